@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Benchmark the AHN tool of pdokservicesplugin against a local WCS stand-in
+
+Runs the PDOK AHN WCS Tool processing algorithm (PDOKWCSTool) over random points
+(EPSG:28992) against the WCS stand-in (see wcs_stand_in.py), once per block size
+and number of concurrent requests, and reports wall time, points/s, requests issued, bytes downloaded and peak memory.
+Each run starts with empty caches.
+
+Needs a python environment with QGIS (for example the python of a QGIS install, on
+Linux set QGIS_PREFIX_PATH when QGIS is not installed in /usr), run from root of repo:
+
+`python3 ./benchmark/benchmark_ahn.py --points 10000 --latency 50 --block-sizes 0,256 --concurrency 1,8`
+
+Use --extent to sample a smaller area, so points share blocks, for example the
+extent of a city: --extent 118000,480000,128000,490000
+
+Peak memory is the peak of the process so far, use a single block size and
+concurrency per process for the peak memory of that run.
+"""
+
+import argparse
+import csv
+import os
+import random
+import tempfile
+
+from harness import (
+    init_qgis,
+    load_delimited_text_layer,
+    print_results,
+    run_benchmark,
+)
+from wcs_stand_in import start_wcs
+
+# extent (EPSG:28992) of the Netherlands mainland
+DEFAULT_EXTENT = (13000, 306000, 278000, 619000)
+
+
+def write_random_points(output_path, nr_of_points, extent, seed=1):
+    """writes nr_of_points random points within extent to a csv file with X,Y columns"""
+    minx, miny, maxx, maxy = extent
+    rng = random.Random(seed)
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["X", "Y"])
+        for _ in range(nr_of_points):
+            writer.writerow(
+                (round(rng.uniform(minx, maxx), 2), round(rng.uniform(miny, maxy), 2))
+            )
+
+
+def parse_extent(value):
+    extent = tuple(float(x) for x in value.split(","))
+    if len(extent) != 4:
+        raise argparse.ArgumentTypeError("extent should be minx,miny,maxx,maxy")
+    return extent
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--points", type=int, default=10000, help="Number of points (default 10000)"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=50,
+        help="Latency of each stand-in response (ms, default 50)",
+    )
+    parser.add_argument(
+        "--block-sizes",
+        default="0,256",
+        help="Comma separated list of block sizes to benchmark (default 0,256)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1",
+        help="Comma separated list of numbers of concurrent requests to benchmark (default 1)",
+    )
+    parser.add_argument(
+        "--coverage",
+        default="dtm_05m",
+        choices=["dtm_05m", "dsm_05m"],
+        help="Coverage to sample (default dtm_05m)",
+    )
+    parser.add_argument(
+        "--extent",
+        type=parse_extent,
+        default=DEFAULT_EXTENT,
+        help="Extent of the random points: minx,miny,maxx,maxy (EPSG:28992, default the Netherlands)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    block_sizes = [int(x) for x in args.block_sizes.split(",")]
+    concurrencies = [int(x) for x in args.concurrency.split(",")]
+
+    app = init_qgis()  # pylint: disable=unused-variable
+
+    import processing
+    from pdokservicesplugin.processing_provider.processing_ahn import PDOKWCSTool
+
+    server, wcs_url = start_wcs(args.latency / 1000)
+    PDOKWCSTool.wcs_url = wcs_url
+    PDOKWCSTool.cap_url = f"{wcs_url}?request=GetCapabilities&service=WCS"
+
+    data_dir = tempfile.mkdtemp(prefix="pdok-benchmark-")
+    points_path = os.path.join(data_dir, "points.csv")
+    write_random_points(points_path, args.points, args.extent)
+    points_layer = load_delimited_text_layer(
+        points_path, "delimiter=,&xField=X&yField=Y&crs=EPSG:28992"
+    )
+
+    def run_ahn_tool(block_size, concurrency):
+        processing.run(
+            "pdokservicesplugin:pdok-ahn-wcs-tool",
+            {
+                "INPUT": points_layer,
+                "COVERAGE_ID": PDOKWCSTool.coverages.index(args.coverage),
+                "ATTRIBUTE_NAME": "elevation",
+                "BLOCK_SIZE": block_size,
+                "MAX_CONCURRENT_REQUESTS": concurrency,
+                "OUTPUT": "TEMPORARY_OUTPUT",
+            },
+        )
+
+    print(
+        f"{args.points} points in extent {args.extent}, coverage {args.coverage}, stand-in latency {args.latency} ms"
+    )
+    results = [
+        run_benchmark(
+            f"ahn bs {block_size} c {concurrency}",
+            lambda block_size=block_size, concurrency=concurrency: run_ahn_tool(
+                block_size, concurrency
+            ),
+            args.points,
+            server,
+        )
+        for block_size in block_sizes
+        for concurrency in concurrencies
+    ]
+    print_results(results)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
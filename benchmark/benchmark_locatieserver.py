@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Benchmark the Locatieserver code of pdokservicesplugin against a local stand-in
+
+Runs the Locatieserver functions (lib/locatieserver.py) and the geocoder and reverse
+geocoder processing algorithms against the Locatieserver stand-in (see
+locatieserver_stand_in.py), and reports wall time, items/s, requests/s, bytes
+received and peak memory of each benchmark.
+
+The inputs are the files in testdata/ scaled up to --rows rows: the house numbers of
+testdata/postcode_huisnummer.csv are varied, so the copies of the file are distinct
+queries, and the points of testdata/reversgeocodepuntjes.csv are moved randomly
+within 250 m.
+
+Needs a python environment with QGIS (for example the python of a QGIS install, on
+Linux set QGIS_PREFIX_PATH when QGIS is not installed in /usr), run from root of repo:
+
+`python3 ./benchmark/benchmark_locatieserver.py --rows 100000 --latency 20 --concurrency 8`
+
+Peak memory is the peak of the process so far, use --benchmarks to run a single
+benchmark per process for the peak memory of that benchmark.
+"""
+
+import argparse
+import csv
+import os
+import random
+import re
+import tempfile
+
+from harness import (
+    init_qgis,
+    load_delimited_text_layer,
+    print_results,
+    run_benchmark,
+    REPO_DIR,
+)
+from locatieserver_stand_in import start_locatieserver
+
+BENCHMARKS = ("suggest", "free", "reverse", "geocoder", "reverse-geocoder")
+
+# postcode, separator and house number of the values in postcode_huisnummer.csv
+HOUSE_NUMBER_PATTERN = re.compile(r"^([0-9]{4}\s?[A-Za-z]{2}[\s,]+)([0-9]+)(.*)$")
+
+
+def scale_postcode_huisnummer(output_path, rows):
+    """
+    writes rows postcode_huisnummer values to a csv file with delimiter ";" (the
+    values contain commas), returns the values
+    """
+    with open(
+        os.path.join(REPO_DIR, "testdata", "postcode_huisnummer.csv"), encoding="utf-8"
+    ) as f:
+        base_values = [line.strip() for line in f.readlines()[1:] if line.strip()]
+    values = []
+    for i in range(rows):
+        value = base_values[i % len(base_values)]
+        repetition = i // len(base_values)
+        match = HOUSE_NUMBER_PATTERN.match(value)
+        if repetition > 0 and match is not None:
+            house_number = int(match.group(2)) + 1000 * repetition
+            value = f"{match.group(1)}{house_number}{match.group(3)}"
+        values.append(value)
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["postcode_huisnummer"])
+        writer.writerows([value] for value in values)
+    return values
+
+
+def scale_reverse_points(output_path, rows, seed=1):
+    """writes rows points (EPSG:28992) around the test points, returns the points"""
+    with open(
+        os.path.join(REPO_DIR, "testdata", "reversgeocodepuntjes.csv"), encoding="utf-8"
+    ) as f:
+        base_points = [(float(row["X"]), float(row["Y"])) for row in csv.DictReader(f)]
+    rng = random.Random(seed)
+    points = []
+    for i in range(rows):
+        x, y = base_points[i % len(base_points)]
+        points.append(
+            (round(x + rng.uniform(-250, 250), 2), round(y + rng.uniform(-250, 250), 2))
+        )
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["X", "Y"])
+        writer.writerows(points)
+    return points
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rows", type=int, default=10000, help="Number of input rows (default 10000)"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=20,
+        help="Latency of each stand-in response (ms, default 20)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Number of concurrent requests of the geocoder algorithm (default 8)",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        default=",".join(BENCHMARKS),
+        help=f"Comma separated list of benchmarks to run (default {','.join(BENCHMARKS)})",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    benchmarks = [x.strip() for x in args.benchmarks.split(",")]
+    unknown = set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    app = init_qgis()  # pylint: disable=unused-variable
+
+    import processing
+    from pdokservicesplugin.lib import locatieserver
+    from pdokservicesplugin.lib.locatieserver import (
+        LsType,
+        Projection,
+        TypeFilter,
+        free_query,
+        reverse_lookup,
+        suggest_query,
+    )
+
+    server, endpoint = start_locatieserver(args.latency / 1000)
+    locatieserver.SERVICE_ENDPOINT = endpoint
+
+    data_dir = tempfile.mkdtemp(prefix="pdok-benchmark-")
+    queries_path = os.path.join(data_dir, "postcode_huisnummer.csv")
+    points_path = os.path.join(data_dir, "reversgeocodepuntjes.csv")
+    queries = scale_postcode_huisnummer(queries_path, args.rows)
+    points = scale_reverse_points(points_path, args.rows)
+    type_filter = TypeFilter([LsType.adres])
+    queries_layer = load_delimited_text_layer(queries_path, "delimiter=;&geomType=none")
+    points_layer = load_delimited_text_layer(
+        points_path, "delimiter=,&xField=X&yField=Y&crs=EPSG:28992"
+    )
+
+    def run_suggest():
+        for query in queries:
+            suggest_query(query)
+
+    def run_free():
+        for query in queries:
+            free_query(
+                query,
+                Projection.EPSG_28992,
+                type_filter,
+                fields=["weergavenaam", "score"],
+            )
+
+    def run_reverse():
+        for x, y in points:
+            reverse_lookup(x, y, ["weergavenaam", "afstand"], type_filter)
+
+    def run_geocoder():
+        processing.run(
+            "pdokservicesplugin:pdok-geocoder",
+            {
+                "INPUT": queries_layer,
+                "SRC_FIELD": '"postcode_huisnummer"',
+                "RESULT_TYPE": 0,  # adres
+                "TARGET_CRS": "EPSG:28992",
+                "MAX_CONCURRENT_REQUESTS": args.concurrency,
+                "OUTPUT": "TEMPORARY_OUTPUT",
+            },
+        )
+
+    def run_reverse_geocoder():
+        processing.run(
+            "pdokservicesplugin:pdok-reverse-geocoder",
+            {
+                "INPUT": points_layer,
+                "FIELDS": "weergavenaam",
+                "RESULT_TYPE": 0,  # adres
+                "OUTPUT": "TEMPORARY_OUTPUT",
+            },
+        )
+
+    benchmark_funcs = {
+        "suggest": run_suggest,
+        "free": run_free,
+        "reverse": run_reverse,
+        "geocoder": run_geocoder,
+        "reverse-geocoder": run_reverse_geocoder,
+    }
+    print(
+        f"{args.rows} rows, stand-in latency {args.latency} ms, geocoder concurrency {args.concurrency}"
+    )
+    results = [
+        run_benchmark(name, benchmark_funcs[name], args.rows, server)
+        for name in benchmarks
+    ]
+    print_results(results)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Shared code of the benchmarks: local stand-in servers for the PDOK services and
+measurement/reporting of benchmark runs
+
+The stand-in servers only use the standard library, so they can also be run outside
+QGIS. The functions that need QGIS import it when called.
+"""
+
+import gzip
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    HTTP server answering every request after latency (seconds), keeps the number of
+    requests and bytes sent
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, handler_class, latency=0.0):
+        super().__init__(address, handler_class)
+        self.latency = latency
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def count_request(self, nr_of_bytes):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += nr_of_bytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "bytes": self.bytes_sent}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    # keep connections open, like the PDOK services
+    protocol_version = "HTTP/1.1"
+
+    def send_body(self, body: bytes, content_type, status=200, etag=None):
+        """
+        sends body after the latency of the server, JSON and XML bodies are gzip
+        compressed when the client accepts it, like the PDOK services do. When etag
+        is passed it is sent as ETag header, and a request with a matching
+        If-None-Match header is answered with 304 (Not Modified) without body.
+        """
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        if etag is not None and etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            self.server.count_request(0)
+            return
+        compress = "gzip" in self.headers.get("Accept-Encoding", "") and (
+            "json" in content_type or "xml" in content_type
+        )
+        if compress:
+            body = gzip.compress(body, compresslevel=6)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count_request(len(body))
+
+    def send_not_found(self):
+        self.send_body(b"not found", "text/plain; charset=utf-8", 404)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass  # do not log every request to stderr
+
+
+def start_server(handler_class, latency=0.0, port=0) -> StandInServer:
+    """starts StandInServer with handler_class on localhost in a daemon thread"""
+    server = StandInServer(("127.0.0.1", port), handler_class, latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def init_qgis():
+    """
+    Initializes a QGIS application with a temporary profile (so the caches of the
+    plugin start empty) and the processing framework with the plugin provider.
+    Returns the QgsApplication, keep a reference to it while benchmarking.
+    """
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    from qgis.core import QgsApplication
+
+    profile_dir = tempfile.mkdtemp(prefix="pdok-benchmark-profile-")
+    QgsApplication.setPrefixPath(os.environ.get("QGIS_PREFIX_PATH", "/usr"), True)
+    app = QgsApplication([], False, profile_dir)
+    app.initQgis()
+
+    from processing.core.Processing import Processing
+    from pdokservicesplugin.processing_provider.provider import Provider
+
+    Processing.initialize()
+    app.processingRegistry().addProvider(Provider())
+    return app
+
+
+def load_delimited_text_layer(path, options: str):
+    """
+    Returns a QgsVectorLayer of the delimited text file path, options are the query
+    of the delimitedtext provider uri, for example "delimiter=,&xField=X&yField=Y".
+    A layer is passed as INPUT of the algorithms, a delimitedtext uri string is not
+    loaded by processing.
+    """
+    from qgis.core import QgsVectorLayer
+
+    uri = f"{pathlib.Path(path).as_uri()}?{options}"
+    layer = QgsVectorLayer(uri, os.path.basename(path), "delimitedtext")
+    if not layer.isValid():
+        raise RuntimeError(f"failed to load delimited text layer {uri}")
+    return layer
+
+
+def clear_plugin_caches():
+    """
+    clears the response, suggest and AHN caches, so every request reaches the
+    stand-in
+    """
+    from pdokservicesplugin.lib.constants import AHN_METADATA_CACHE_TTL
+    from pdokservicesplugin.lib.response_cache import get_response_cache
+    from pdokservicesplugin.lib.suggest_cache import get_suggest_cache
+    from pdokservicesplugin.lib.tile_cache import get_ahn_tile_cache
+
+    get_response_cache().clear()
+    get_response_cache("ahn_metadata", AHN_METADATA_CACHE_TTL).clear()
+    get_suggest_cache().clear()
+    get_ahn_tile_cache().clear()
+
+
+class BenchmarkResult:
+    def __init__(self, name, items, wall_time, requests, nr_of_bytes, peak_memory):
+        self.name = name
+        self.items = items
+        self.wall_time = wall_time
+        self.requests = requests
+        self.bytes = nr_of_bytes
+        self.peak_memory = peak_memory
+
+
+def run_benchmark(name, func, items, server) -> BenchmarkResult:
+    """
+    Runs func (without arguments) processing items (number of input items), returns
+    BenchmarkResult with the wall time and the requests and bytes served by server.
+    Peak memory is the peak of the process so far, run the benchmark with the
+    highest memory use last, or one benchmark per process.
+    """
+    from pdokservicesplugin.lib.util import get_peak_memory
+
+    clear_plugin_caches()
+    start_stats = server.snapshot()
+    start_time = time.perf_counter()
+    func()
+    wall_time = time.perf_counter() - start_time
+    stats = server.snapshot()
+    return BenchmarkResult(
+        name,
+        items,
+        wall_time,
+        stats["requests"] - start_stats["requests"],
+        stats["bytes"] - start_stats["bytes"],
+        get_peak_memory(),
+    )
+
+
+def print_results(results: "list[BenchmarkResult]"):
+    from pdokservicesplugin.lib.util import format_memory
+
+    header = f"{'benchmark':<20} {'items':>8} {'wall time':>10} {'items/s':>9} {'requests':>9} {'requests/s':>10} {'MB received':>11} {'peak memory':>12}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        wall_time = max(result.wall_time, 1e-9)
+        print(
+            f"{result.name:<20} {result.items:>8} {result.wall_time:>9.2f}s {result.items / wall_time:>9.1f} {result.requests:>9} {result.requests / wall_time:>10.1f} {result.bytes / (1024 * 1024):>11.2f} {format_memory(result.peak_memory):>12}"
+        )
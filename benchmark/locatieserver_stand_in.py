@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Local stand-in for the PDOK Locatieserver API (/suggest, /free, /reverse and /lookup)
+
+Serves the responses in benchmark/responses/locatieserver/{endpoint}.json after a
+configurable latency, so the Locatieserver code of the plugin can be benchmarked
+without hitting the live API. Replace the response files with responses recorded
+from the live API to benchmark with other payloads, for example:
+
+`curl "https://api.pdok.nl/bzk/locatieserver/search/v3_1/free?q=2022ZJ%2023" > benchmark/responses/locatieserver/free.json`
+
+The stand-in applies the rows (number of docs) and fl (fields) parameters to the
+docs of the response, and derives the ids of the docs from the query, so distinct
+queries get distinct results. Lookups (/lookup?id=.. and /free with an id filter)
+return the lookup doc with the requested ids.
+
+Run it standalone with (run from root of repo):
+
+`python3 ./benchmark/locatieserver_stand_in.py --port 8080 --latency 20`
+
+and point the plugin to http://127.0.0.1:8080/bzk/locatieserver/search/v3_1 by setting
+pdokservicesplugin.lib.locatieserver.SERVICE_ENDPOINT.
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+
+from harness import StandInRequestHandler, StandInServer, start_server
+
+SERVICE_PATH = "/bzk/locatieserver/search/v3_1"
+RESPONSES_DIR = os.path.join(os.path.dirname(__file__), "responses", "locatieserver")
+ENDPOINTS = ("suggest", "free", "reverse", "lookup")
+
+ID_FILTER_PATTERN = re.compile(r"^id:\((.*)\)$")
+QUOTED_PATTERN = re.compile(r'"([^"]+)"')
+
+
+def load_responses(responses_dir=RESPONSES_DIR) -> dict:
+    responses = {}
+    for endpoint in ENDPOINTS:
+        with open(
+            os.path.join(responses_dir, f"{endpoint}.json"), encoding="utf-8"
+        ) as f:
+            responses[endpoint] = json.load(f)
+    return responses
+
+
+def select_fields(doc, fl):
+    if fl is None or fl == "*":
+        return doc
+    fields = fl.split(",")
+    return {key: value for key, value in doc.items() if key in fields}
+
+
+def with_query_id(doc, query):
+    """returns copy of doc with an id unique for query"""
+    doc = dict(doc)
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+    doc["id"] = f"{doc['id'].split('-')[0]}-{digest}{doc['id'][-4:]}"
+    return doc
+
+
+class LocatieserverRequestHandler(StandInRequestHandler):
+    # set by start_locatieserver
+    responses = None
+
+    def do_GET(self):
+        parse_result = urllib.parse.urlsplit(self.path)
+        endpoint = parse_result.path[len(SERVICE_PATH) + 1 :]
+        if not parse_result.path.startswith(SERVICE_PATH) or endpoint not in ENDPOINTS:
+            self.send_not_found()
+            return
+        params = dict(urllib.parse.parse_qsl(parse_result.query))
+        rows = int(params.get("rows", 10))
+        fl = params.get("fl")
+
+        id_filter = ID_FILTER_PATTERN.match(params.get("fq", ""))
+        if endpoint == "lookup":
+            docs = self.get_lookup_docs([params.get("id", "")])
+        elif endpoint == "free" and id_filter is not None:
+            docs = self.get_lookup_docs(QUOTED_PATTERN.findall(id_filter.group(1)))
+        else:
+            if endpoint == "reverse":
+                query = f"{params.get('X')},{params.get('Y')}"
+            else:
+                query = params.get("q", "")
+            docs = [
+                with_query_id(doc, query)
+                for doc in self.responses[endpoint]["response"]["docs"]
+            ]
+        content_obj = copy.deepcopy(self.responses[endpoint])
+        content_obj["response"]["numFound"] = len(docs)
+        content_obj["response"]["docs"] = [
+            select_fields(doc, fl) for doc in docs[:rows]
+        ]
+        self.send_body(
+            json.dumps(content_obj).encode("utf-8"), "application/json;charset=UTF-8"
+        )
+
+    def get_lookup_docs(self, object_ids):
+        template = self.responses["lookup"]["response"]["docs"][0]
+        return [dict(template, id=object_id) for object_id in object_ids]
+
+
+def get_handler_class(responses_dir=RESPONSES_DIR):
+    return type(
+        "LocatieserverRequestHandler",
+        (LocatieserverRequestHandler,),
+        {"responses": load_responses(responses_dir)},
+    )
+
+
+def start_locatieserver(latency=0.0, port=0, responses_dir=RESPONSES_DIR):
+    """
+    Starts the Locatieserver stand-in in a daemon thread, returns tuple of the server
+    and the service endpoint url (the value for SERVICE_ENDPOINT)
+    """
+    server = start_server(get_handler_class(responses_dir), latency, port)
+    return server, f"{server.base_url}{SERVICE_PATH}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Latency of each response (ms)"
+    )
+    parser.add_argument("--responses-dir", default=RESPONSES_DIR)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = StandInServer(
+        ("127.0.0.1", args.port),
+        get_handler_class(args.responses_dir),
+        args.latency / 1000,
+    )
+    print(
+        f"Locatieserver stand-in running at {server.base_url}{SERVICE_PATH} (ctrl+c to stop)"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
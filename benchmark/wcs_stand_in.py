@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Local stand-in for the PDOK AHN WCS 2.0.1 service
+
+Serves GetCapabilities, DescribeCoverage and GetCoverage for the dtm_05m and dsm_05m
+coverages, with the extent and 0.5 m grid of the AHN, after a configurable latency.
+The capabilities and coverage descriptions have an ETag, conditional requests for
+them are answered with 304 (Not Modified).
+So the AHN tool of the plugin (PDOKWCSTool) can be benchmarked without hitting the
+live service.
+
+GetCoverage returns an uncompressed float32 GeoTIFF (EPSG:28992) with synthetic
+elevations, computed from the coordinates: gentle waves for the terrain (dtm), plus
+blocks of "buildings" for the surface (dsm). Rows of cells where y // 2000 is a
+multiple of 13 are NODATA, like water in the AHN.
+
+Run it standalone with (run from root of repo):
+
+`python3 ./benchmark/wcs_stand_in.py --port 8081 --latency 50`
+
+and point the plugin to http://127.0.0.1:8081/rws/ahn/wcs/v1_0 by setting
+PDOKWCSTool.wcs_url and PDOKWCSTool.cap_url.
+"""
+
+import argparse
+import array
+import hashlib
+import math
+import re
+import struct
+import sys
+import urllib.parse
+
+from harness import StandInRequestHandler, StandInServer, start_server
+
+SERVICE_PATH = "/rws/ahn/wcs/v1_0"
+COVERAGES = ("dtm_05m", "dsm_05m")
+BBOX = (10000.0, 306250.0, 280000.0, 625000.0)
+CELL_SIZE = 0.5
+NODATA = 3.4028234663852886e38
+# largest GetCoverage response in cells (the AHN tool requests at most 4096x4096)
+MAX_CELLS = 4096 * 4096
+
+SUBSET_PATTERN = re.compile(r"^([xy])\(([^,]+),([^)]+)\)$")
+
+CAPABILITIES_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<wcs:Capabilities xmlns:wcs="http://www.opengis.net/wcs/2.0" xmlns:ows="http://www.opengis.net/ows/2.0" xmlns:xlink="http://www.w3.org/1999/xlink" version="2.0.1">
+  <ows:ServiceIdentification>
+    <ows:Title>AHN WCS stand-in</ows:Title>
+    <ows:Abstract>Local stand-in of the AHN WCS for benchmarks, synthetic elevations</ows:Abstract>
+    <ows:ServiceType>OGC WCS</ows:ServiceType>
+    <ows:ServiceTypeVersion>2.0.1</ows:ServiceTypeVersion>
+  </ows:ServiceIdentification>
+  <ows:ServiceProvider>
+    <ows:ProviderName>pdokservicesplugin benchmark</ows:ProviderName>
+  </ows:ServiceProvider>
+  <ows:OperationsMetadata>
+{operations}
+  </ows:OperationsMetadata>
+  <wcs:Contents>
+{coverage_summaries}
+  </wcs:Contents>
+</wcs:Capabilities>
+"""
+
+OPERATION_TEMPLATE = """    <ows:Operation name="{name}">
+      <ows:DCP><ows:HTTP><ows:Get xlink:href="{url}?"/></ows:HTTP></ows:DCP>
+    </ows:Operation>"""
+
+COVERAGE_SUMMARY_TEMPLATE = """    <wcs:CoverageSummary>
+      <wcs:CoverageId>{coverage_id}</wcs:CoverageId>
+      <wcs:CoverageSubtype>RectifiedGridCoverage</wcs:CoverageSubtype>
+    </wcs:CoverageSummary>"""
+
+DESCRIBE_COVERAGE_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<wcs:CoverageDescriptions xmlns:wcs="http://www.opengis.net/wcs/2.0" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:gmlcov="http://www.opengis.net/gmlcov/1.0" xmlns:swe="http://www.opengis.net/swe/2.0">
+  <wcs:CoverageDescription gml:id="{coverage_id}">
+    <gml:boundedBy>
+      <gml:Envelope srsName="http://www.opengis.net/def/crs/EPSG/0/28992" axisLabels="x y" uomLabels="m m" srsDimension="2">
+        <gml:lowerCorner>{minx} {miny}</gml:lowerCorner>
+        <gml:upperCorner>{maxx} {maxy}</gml:upperCorner>
+      </gml:Envelope>
+    </gml:boundedBy>
+    <wcs:CoverageId>{coverage_id}</wcs:CoverageId>
+    <gml:domainSet>
+      <gml:RectifiedGrid dimension="2" gml:id="grid_{coverage_id}">
+        <gml:limits>
+          <gml:GridEnvelope>
+            <gml:low>0 0</gml:low>
+            <gml:high>{high_x} {high_y}</gml:high>
+          </gml:GridEnvelope>
+        </gml:limits>
+        <gml:axisLabels>x y</gml:axisLabels>
+        <gml:origin>
+          <gml:Point gml:id="origin_{coverage_id}" srsName="http://www.opengis.net/def/crs/EPSG/0/28992">
+            <gml:pos>{minx} {maxy}</gml:pos>
+          </gml:Point>
+        </gml:origin>
+        <gml:offsetVector srsName="http://www.opengis.net/def/crs/EPSG/0/28992">{cell_size} 0</gml:offsetVector>
+        <gml:offsetVector srsName="http://www.opengis.net/def/crs/EPSG/0/28992">0 -{cell_size}</gml:offsetVector>
+      </gml:RectifiedGrid>
+    </gml:domainSet>
+    <gmlcov:rangeType>
+      <swe:DataRecord>
+        <swe:field name="elevation">
+          <swe:Quantity>
+            <swe:nilValues><swe:NilValues><swe:nilValue reason="http://www.opengis.net/def/nil/OGC/0/unknown">{nodata}</swe:nilValue></swe:NilValues></swe:nilValues>
+            <swe:uom code="m"/>
+          </swe:Quantity>
+        </swe:field>
+      </swe:DataRecord>
+    </gmlcov:rangeType>
+    <wcs:ServiceParameters>
+      <wcs:CoverageSubtype>RectifiedGridCoverage</wcs:CoverageSubtype>
+      <wcs:nativeFormat>image/tiff</wcs:nativeFormat>
+    </wcs:ServiceParameters>
+  </wcs:CoverageDescription>
+</wcs:CoverageDescriptions>
+"""
+
+
+def get_elevations(coverage_id, minx, maxy, width, height) -> array.array:
+    """
+    returns the synthetic elevations (row major, top row first) of the width x height
+    cells with upper left corner minx, maxy
+    """
+    # the terrain is the sum of a wave along x and a wave along y, so the values of
+    # a row are computed with one addition per cell
+    xs = [minx + (col + 0.5) * CELL_SIZE for col in range(width)]
+    terrain_x = [2.5 * math.sin(x / 750) for x in xs]
+    # columns with buildings, the rows with buildings are selected below
+    buildings = [(x // 15) % 4 == 0 for x in xs]
+    values = array.array("f")
+    for row in range(height):
+        y = maxy - (row + 0.5) * CELL_SIZE
+        if (y // 2000) % 13 == 0:
+            values.extend([NODATA] * width)
+            continue
+        terrain_y = 1.5 * math.cos(y / 1100) - 1.0
+        if coverage_id == "dsm_05m" and (y // 15) % 3 == 0:
+            values.extend(
+                [
+                    tx + terrain_y + (9.0 if building else 0.0)
+                    for tx, building in zip(terrain_x, buildings)
+                ]
+            )
+        else:
+            values.extend([tx + terrain_y for tx in terrain_x])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def get_geotiff(values: array.array, minx, maxy, width, height) -> bytes:
+    """returns uncompressed single band float32 GeoTIFF (EPSG:28992) of values"""
+    nodata = f"{NODATA!r}\0".encode("ascii")
+    # (tag, type, values), type 2 is ASCII, 3 SHORT, 4 LONG and 12 DOUBLE
+    entries = [
+        (256, 4, [width]),  # ImageWidth
+        (257, 4, [height]),  # ImageLength
+        (258, 3, [32]),  # BitsPerSample
+        (259, 3, [1]),  # Compression: none
+        (262, 3, [1]),  # PhotometricInterpretation: min is black
+        (273, 4, [0]),  # StripOffsets, set below
+        (277, 3, [1]),  # SamplesPerPixel
+        (278, 4, [height]),  # RowsPerStrip
+        (279, 4, [width * height * 4]),  # StripByteCounts
+        (284, 3, [1]),  # PlanarConfiguration: contiguous
+        (339, 3, [3]),  # SampleFormat: float
+        (33550, 12, [CELL_SIZE, CELL_SIZE, 0.0]),  # ModelPixelScale
+        (33922, 12, [0.0, 0.0, 0.0, minx, maxy, 0.0]),  # ModelTiepoint
+        # GeoKeyDirectory: projected, pixel is area, EPSG:28992
+        (34735, 3, [1, 1, 0, 3, 1024, 0, 1, 1, 1025, 0, 1, 1, 3072, 0, 1, 28992]),
+        (42113, 2, nodata),  # GDAL_NODATA
+    ]
+    formats = {3: "H", 4: "I", 12: "d"}
+
+    def pack(field_type, value):
+        if field_type == 2:
+            return bytes(value)
+        return struct.pack(f"<{len(value)}{formats[field_type]}", *value)
+
+    # values larger than 4 bytes are stored after the IFD, followed by the image
+    data_offset = 8 + 2 + len(entries) * 12 + 4
+    image_offset = data_offset + sum(
+        len(pack(t, v)) for _, t, v in entries if len(pack(t, v)) > 4
+    )
+    ifd = struct.pack("<H", len(entries))
+    data = b""
+    for tag, field_type, value in entries:
+        if tag == 273:
+            value = [image_offset]
+        packed = pack(field_type, value)
+        count = len(packed) if field_type == 2 else len(value)
+        if len(packed) <= 4:
+            ifd += struct.pack("<HHI", tag, field_type, count) + packed.ljust(4, b"\0")
+        else:
+            ifd += struct.pack("<HHII", tag, field_type, count, data_offset + len(data))
+            data += packed
+    ifd += struct.pack("<I", 0)  # no next IFD
+    return b"II*\0" + struct.pack("<I", 8) + ifd + data + values.tobytes()
+
+
+def get_capabilities(url) -> bytes:
+    operations = "\n".join(
+        OPERATION_TEMPLATE.format(name=name, url=url)
+        for name in ("GetCapabilities", "DescribeCoverage", "GetCoverage")
+    )
+    coverage_summaries = "\n".join(
+        COVERAGE_SUMMARY_TEMPLATE.format(coverage_id=coverage_id)
+        for coverage_id in COVERAGES
+    )
+    return CAPABILITIES_TEMPLATE.format(
+        operations=operations, coverage_summaries=coverage_summaries
+    ).encode("utf-8")
+
+
+def get_describe_coverage(coverage_id) -> bytes:
+    minx, miny, maxx, maxy = BBOX
+    return DESCRIBE_COVERAGE_TEMPLATE.format(
+        coverage_id=coverage_id,
+        minx=minx,
+        miny=miny,
+        maxx=maxx,
+        maxy=maxy,
+        high_x=round((maxx - minx) / CELL_SIZE) - 1,
+        high_y=round((maxy - miny) / CELL_SIZE) - 1,
+        cell_size=CELL_SIZE,
+        nodata=NODATA,
+    ).encode("utf-8")
+
+
+def get_subset_window(subsets):
+    """
+    returns (minx, maxy, width, height) of the cells in the subsets (list of values
+    of the subset parameter, like "x(1000,1001)"), clipped to the coverage, None when
+    the subsets are invalid or outside the coverage
+    """
+    minx, miny, maxx, maxy = BBOX
+    for subset in subsets:
+        match = SUBSET_PATTERN.match(subset.replace(" ", ""))
+        if match is None:
+            return None
+        low, high = float(match.group(2)), float(match.group(3))
+        if match.group(1) == "x":
+            minx, maxx = max(minx, low), min(maxx, high)
+        else:
+            miny, maxy = max(miny, low), min(maxy, high)
+    # snap to the grid of the coverage
+    minx = BBOX[0] + math.floor((minx - BBOX[0]) / CELL_SIZE) * CELL_SIZE
+    maxy = BBOX[3] - math.floor((BBOX[3] - maxy) / CELL_SIZE) * CELL_SIZE
+    width = math.ceil((maxx - minx) / CELL_SIZE)
+    height = math.ceil((maxy - miny) / CELL_SIZE)
+    if width <= 0 or height <= 0:
+        return None
+    return minx, maxy, width, height
+
+
+class WcsRequestHandler(StandInRequestHandler):
+    def do_GET(self):
+        parse_result = urllib.parse.urlsplit(self.path)
+        if parse_result.path != SERVICE_PATH:
+            self.send_not_found()
+            return
+        # parameter names are case insensitive, subset can be repeated
+        params = {}
+        for key, value in urllib.parse.parse_qsl(parse_result.query):
+            params.setdefault(key.lower(), []).append(value)
+        request = params.get("request", [""])[0].lower()
+        coverage_id = params.get("coverageid", [""])[0]
+
+        if request == "getcapabilities":
+            url = f"http://{self.headers.get('Host')}{SERVICE_PATH}"
+            self.send_document(get_capabilities(url))
+        elif request == "describecoverage" and coverage_id in COVERAGES:
+            self.send_document(get_describe_coverage(coverage_id))
+        elif request == "getcoverage" and coverage_id in COVERAGES:
+            window = get_subset_window(params.get("subset", []))
+            if window is None or window[2] * window[3] > MAX_CELLS:
+                self.send_exception("InvalidSubsetting", 400)
+                return
+            values = get_elevations(coverage_id, *window)
+            self.send_body(get_geotiff(values, *window), "image/tiff")
+        else:
+            self.send_exception("InvalidParameterValue", 400)
+
+    def send_document(self, body: bytes):
+        """sends XML document body with an ETag, so it can be revalidated"""
+        etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        self.send_body(body, "text/xml; charset=UTF-8", etag=etag)
+
+    def send_exception(self, exception_code, status):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/2.0" version="2.0.1">'
+            f'<ows:Exception exceptionCode="{exception_code}"/>'
+            "</ows:ExceptionReport>"
+        )
+        self.send_body(body.encode("utf-8"), "text/xml; charset=UTF-8", status)
+
+
+def start_wcs(latency=0.0, port=0):
+    """
+    Starts the WCS stand-in in a daemon thread, returns tuple of the server and the
+    service url (the value for PDOKWCSTool.wcs_url)
+    """
+    server = start_server(WcsRequestHandler, latency, port)
+    return server, f"{server.base_url}{SERVICE_PATH}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Latency of each response (ms)"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = StandInServer(
+        ("127.0.0.1", args.port), WcsRequestHandler, args.latency / 1000
+    )
+    print(f"WCS stand-in running at {server.base_url}{SERVICE_PATH} (ctrl+c to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,3 +2,17 @@ PLUGIN_NAME = "PDOK Services Plugin"
 PLUGIN_ID = "pdokservicesplugin"
 DEFAULT_NR_FAVS = "2"
 SETTINGS_SECTIONS = f"/{PLUGIN_ID}/"
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+RESPONSE_CACHE_MAX_SIZE = 200 * 1024 * 1024  # bytes
+# seconds, expired responses with an ETag or Last-Modified header are kept this long
+# after expiry, to be revalidated with a conditional request
+RESPONSE_CACHE_MAX_STALE = 30 * 24 * 60 * 60
+AHN_METADATA_CACHE_TTL = 24 * 60 * 60  # seconds
+AHN_TILE_CACHE_MAX_SIZE = 1024 * 1024 * 1024  # bytes
+SUGGEST_CACHE_SIZE = 256  # number of suggest queries kept in memory
+HTTP_MAX_RETRIES = 5  # retries of a request (with feedback) answered with 429 or 5xx
+HTTP_BACKOFF_BASE = 0.5  # seconds, delay before the first retry (without jitter)
+HTTP_BACKOFF_MAX = 30  # seconds
+HTTP_RETRY_AFTER_MAX = 120  # seconds, upper limit for the Retry-After header
+HTTP_RATE_LIMIT_MIN = 1  # requests per second per host, lower limit after 429s
+HTTP_MAX_WORKERS = 32  # threads of the pool for concurrent requests
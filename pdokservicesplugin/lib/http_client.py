@@ -1,9 +1,41 @@
+import email.utils
 import json
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
-from qgis.PyQt.QtCore import QUrl
-from qgis.core import QgsBlockingNetworkRequest
+from qgis.PyQt.QtCore import QByteArray, QUrl
+from qgis.core import QgsBlockingNetworkRequest, QgsNetworkAccessManager
 from http.client import responses
 
+from .constants import (
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+    HTTP_RETRY_AFTER_MAX,
+    HTTP_RATE_LIMIT_MIN,
+    HTTP_MAX_WORKERS,
+    PLUGIN_ID,
+)
+from .profiling import bind_profiler, profile_stage, profiled
+
+# HTTP status codes of responses that are retried
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# dynamic property marking the network access managers the client is connected to
+CONNECTED_PROPERTY = f"{PLUGIN_ID}_http_client_connected"
+# dynamic property of an asynchronous reply with the start time of its request
+START_TIME_PROPERTY = f"{PLUGIN_ID}_start_time"
+# network errors (without HTTP status) that are retried
+RETRY_NETWORK_ERRORS = {
+    QNetworkReply.NetworkError.RemoteHostClosedError,
+    QNetworkReply.NetworkError.TimeoutError,
+    QNetworkReply.NetworkError.TemporaryNetworkFailureError,
+}
+
 
 class PdokServicesNetworkException(Exception):
     """Raise for my specific kind of exception"""
@@ -11,15 +43,476 @@ class PdokServicesNetworkException(Exception):
     pass
 
 
-def get_reply(url):
-    qgs_request = QgsBlockingNetworkRequest()
+class PdokServicesCancelledException(PdokServicesNetworkException):
+    """Raised when a request is aborted because the feedback was canceled"""
+
+    pass
+
+
+def get_network_request(url) -> QNetworkRequest:
     request = QNetworkRequest(QUrl(url))
     request.setRawHeader(b"User-Agent", b"qgis-pdokservices-plugin")
-    _ = qgs_request.get(
-        request, True
-    )  # not sure if it is necessary to to test if error is returned here, the reply.error() call also seems to catch network errors, that's why return value of qgs_request.get is not examined
+    return request
+
+
+def decode_content(content: bytes, content_encoding: str) -> bytes:
+    """returns content decompressed according to the Content-Encoding header value"""
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity") or len(content) == 0:
+        return content
+    try:
+        if encoding in ("gzip", "x-gzip"):
+            return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+        if encoding == "deflate":
+            try:
+                return zlib.decompress(content)
+            except zlib.error:
+                # some servers send raw deflate data, without the zlib wrapper
+                return zlib.decompress(content, -zlib.MAX_WBITS)
+    except zlib.error as ex:
+        raise PdokServicesNetworkException(
+            f"failed to decompress {encoding} response: {ex}"
+        ) from ex
+    raise PdokServicesNetworkException(
+        f"unsupported Content-Encoding of response: {content_encoding}"
+    )
+
+
+def check_canceled(url, feedback):
+    if feedback is not None and feedback.isCanceled():
+        raise PdokServicesCancelledException(f"request canceled: {url}")
+
+
+def sleep(seconds, url, feedback=None):
+    """sleeps seconds, raises PdokServicesCancelledException when feedback is canceled"""
+    end_time = time.monotonic() + seconds
+    while True:
+        check_canceled(url, feedback)
+        remaining = end_time - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 0.1))
+
+
+class RateLimiter:
+    """
+    Adaptive rate limiter for the requests to one host, acquire blocks until a
+    request may be sent.
+
+    Requests are not limited until the service answers with 429 (Too Many
+    Requests), so concurrent requests run at full speed. After a 429 the rate is set
+    to half the rate of the requests in the last second, and then adapts with AIMD:
+    it is halved on a next 429 (at most once per second, as the concurrent requests
+    of one burst get their 429 together) and increases by about one request per
+    second for every second of successful requests. There is no upper limit, so the
+    rate keeps growing while the service accepts it. A Retry-After delay of a 429
+    response pauses all requests to the host.
+    """
+
+    # seconds over which the request rate is measured
+    WINDOW = 1.0
+
+    def __init__(self, min_rate=HTTP_RATE_LIMIT_MIN):
+        self.min_rate = min_rate
+        self.rate = None  # requests per second, None is not limited
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._decreased = None  # time of the last decrease of the rate
+        self._paused_until = 0.0
+        self._recent = deque()  # times of the requests in the last WINDOW seconds
+        self._lock = threading.Lock()
+
+    def _record(self, now):
+        """records a request at now, caller should hold the lock"""
+        self._recent.append(now)
+        while self._recent[0] <= now - self.WINDOW:
+            self._recent.popleft()
+
+    def acquire(self, url, feedback=None):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        self._record(now)
+                        return
+                    # allow a burst of one second
+                    self._tokens = min(
+                        max(1.0, self.rate),
+                        self._tokens + (now - self._updated) * self.rate,
+                    )
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self._record(now)
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            sleep(wait, url, feedback)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate is not None:
+                self.rate += 1 / self.rate
+
+    def on_throttled(self, retry_after=None):
+        """call when a request is answered with 429, with its Retry-After delay"""
+        with self._lock:
+            now = time.monotonic()
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if self._decreased is not None and now - self._decreased < self.WINDOW:
+                return
+            self._decreased = now
+            while self._recent and self._recent[0] <= now - self.WINDOW:
+                self._recent.popleft()
+            rate = len(self._recent) / self.WINDOW
+            if self.rate is not None:
+                rate = min(rate, self.rate)
+            self.rate = max(self.min_rate, rate / 2)
+            self._tokens = 0.0
+            self._updated = now
+
+
+def get_retry_after(reply):
+    """returns the delay (seconds) of the Retry-After header of reply, None if absent"""
+    value = bytes(reply.rawHeader(b"Retry-After")).decode("ascii", "ignore").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
 
-    reply = qgs_request.reply()
+def get_backoff_delay(attempt):
+    """returns exponential backoff delay (seconds) with full jitter for attempt (0..)"""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**attempt))
+
+
+class HttpClient:
+    """
+    Client all requests of the plugin (Locatieserver and WCS) go through: blocking
+    requests with get, and the non-blocking requests of the toolbar search with
+    get_async.
+
+    Each thread reuses one QgsBlockingNetworkRequest, on the network access manager
+    of that thread, so TCP connections and TLS sessions are kept alive between
+    requests. Worker threads are reused as well, see get_executor, so concurrent
+    requests keep their connections during a processing run. All concurrent requests
+    share one pool of HTTP_MAX_WORKERS threads, see imap_ordered for the limit per
+    call.
+
+    Requests are scheduled with a RateLimiter per host, which only limits the
+    requests once the host answers with 429. Requests answered with 429
+    or 5xx, or failing with a temporary network error, are retried (all requests are
+    idempotent GETs) after the Retry-After delay of the response or an exponential
+    backoff delay with jitter. Only requests with a feedback (processing algorithms,
+    locator filter fetches) are retried, as the feedback can cancel the wait;
+    requests without feedback are made on the GUI thread, which should not block
+    for the retry delays.
+
+    Compressed (gzip or deflate) responses are requested and decompressed by the
+    client, instead of by Qt, so the client knows both the number of bytes received
+    and the number of bytes after decompression.
+
+    The client keeps statistics: number of requests, retries, bytes received (and
+    after decompression), connection setups and latencies. Connection setups are
+    counted as the completed TLS handshakes of the requests of the client (the
+    encrypted signal of the network access manager), a request on a reused
+    connection does not do a handshake. Plain HTTP requests (like the requests to
+    the benchmark stand-ins) do no handshake, so for those the count stays 0.
+    """
+
+    # number of latencies kept for the percentile
+    MAX_LATENCIES = 100000
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._rate_limiters = {}  # host -> RateLimiter
+        self._requests = 0
+        self._retries = 0
+        self._bytes = 0
+        self._bytes_decoded = 0
+        self._connection_setups = 0
+        self._latencies = deque(maxlen=self.MAX_LATENCIES)
+
+    def _get_blocking_request(self) -> QgsBlockingNetworkRequest:
+        qgs_request = getattr(self._local, "qgs_request", None)
+        if qgs_request is None:
+            qgs_request = QgsBlockingNetworkRequest()
+            self._connect_manager()
+            self._local.qgs_request = qgs_request
+        return qgs_request
+
+    def _connect_manager(self) -> QgsNetworkAccessManager:
+        """
+        returns the network access manager of the current thread, connected to
+        _on_connection_setup. The manager can outlive the thread local (threads of a
+        pool are reused), so it is connected only once.
+        """
+        manager = QgsNetworkAccessManager.instance()
+        if not manager.property(CONNECTED_PROPERTY):
+            manager.encrypted.connect(self._on_connection_setup)
+            manager.setProperty(CONNECTED_PROPERTY, True)
+        return manager
+
+    def _on_connection_setup(self, reply):
+        # the manager is shared with the rest of QGIS, only count requests of the
+        # client, see get
+        if reply.request().attribute(QNetworkRequest.Attribute.User) != PLUGIN_ID:
+            return
+        with self._lock:
+            self._connection_setups += 1
+
+    def _record_request(self, nr_of_bytes, nr_of_bytes_decoded, latency):
+        with self._lock:
+            self._requests += 1
+            self._bytes += nr_of_bytes
+            self._bytes_decoded += nr_of_bytes_decoded
+            self._latencies.append(latency)
+
+    def get_rate_limiter(self, url) -> RateLimiter:
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._rate_limiters:
+                self._rate_limiters[host] = RateLimiter()
+            return self._rate_limiters[host]
+
+    @staticmethod
+    def get_retry_delay(reply, attempt):
+        """returns the delay (seconds) before retrying reply, None if not retryable"""
+        if reply.error() == QNetworkReply.NetworkError.NoError:
+            return None
+        status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if status_code is None:
+            if reply.error() not in RETRY_NETWORK_ERRORS:
+                return None
+        elif status_code not in RETRY_STATUS_CODES:
+            return None
+        retry_after = get_retry_after(reply)
+        if retry_after is not None:
+            return min(retry_after, HTTP_RETRY_AFTER_MAX)
+        return get_backoff_delay(attempt)
+
+    def get(self, url, feedback=None, headers: dict = None):
+        """
+        Executes GET request for url, with the extra request headers (dict with
+        header name and value) when passed, and returns the reply, raises
+        PdokServicesNetworkException when the request fails.
+
+        When a QgsFeedback is passed, the request is aborted when the feedback is
+        canceled, and PdokServicesCancelledException is raised. Only requests with a
+        feedback are retried, see HttpClient.
+        """
+        check_canceled(url, feedback)
+        max_retries = HTTP_MAX_RETRIES if feedback is not None else 0
+        qgs_request = self._get_blocking_request()
+        rate_limiter = self.get_rate_limiter(url)
+        request = get_network_request(url)
+        # marks the request as a request of the client, see _on_connection_setup
+        request.setAttribute(QNetworkRequest.Attribute.User, PLUGIN_ID)
+        for name, value in (headers or {}).items():
+            request.setRawHeader(name.encode("ascii"), value.encode("latin-1"))
+        # when Accept-Encoding is set on the request, Qt leaves the response as is,
+        # see decode_reply
+        request.setRawHeader(b"Accept-Encoding", b"gzip, deflate")
+        for attempt in range(max_retries + 1):
+            rate_limiter.acquire(url, feedback)
+            start_time = time.perf_counter()
+            _ = qgs_request.get(
+                request, True, feedback
+            )  # not sure if it is necessary to to test if error is returned here, the reply.error() call also seems to catch network errors, that's why return value of qgs_request.get is not examined
+            latency = time.perf_counter() - start_time
+            check_canceled(url, feedback)
+
+            reply = qgs_request.reply()
+            nr_of_bytes, nr_of_bytes_decoded = self.decode_reply(reply)
+            self._record_request(nr_of_bytes, nr_of_bytes_decoded, latency)
+            retry_delay = self.get_retry_delay(reply, attempt)
+            if retry_delay is None:
+                if reply.error() == QNetworkReply.NetworkError.NoError:
+                    rate_limiter.on_success()
+                break
+            status_code = reply.attribute(
+                QNetworkRequest.Attribute.HttpStatusCodeAttribute
+            )
+            if status_code == 429:
+                retry_after = get_retry_after(reply)
+                if retry_after is not None:
+                    retry_after = min(retry_after, HTTP_RETRY_AFTER_MAX)
+                rate_limiter.on_throttled(retry_after)
+            if attempt == max_retries:
+                break
+            with self._lock:
+                self._retries += 1
+            with profile_stage("HTTP retry wait"):
+                sleep(retry_delay, url, feedback)
+        check_reply(reply)
+        return reply
+
+    def get_async(self, url) -> QNetworkReply:
+        """
+        Starts a non-blocking GET request for url with the network access manager of
+        the current thread and returns the QNetworkReply, read the response with
+        read_async_reply (so the request is counted in the statistics). Asynchronous
+        requests are not rate limited or retried.
+        """
+        request = get_network_request(url)
+        request.setAttribute(QNetworkRequest.Attribute.User, PLUGIN_ID)
+        request.setRawHeader(b"Accept-Encoding", b"gzip, deflate")
+        reply = self._connect_manager().get(request)
+        reply.setProperty(START_TIME_PROPERTY, time.perf_counter())
+        return reply
+
+    def read_async_reply(self, reply) -> bytes:
+        """
+        returns the (decompressed) content of finished reply of get_async, and adds
+        the request to the statistics
+        """
+        latency = time.perf_counter() - reply.property(START_TIME_PROPERTY)
+        content = bytes(reply.readAll())
+        content_encoding = bytes(reply.rawHeader(b"Content-Encoding")).decode(
+            "ascii", "ignore"
+        )
+        self._record_request(len(content), 0, latency)
+        decoded = decode_content(content, content_encoding)
+        with self._lock:
+            self._bytes_decoded += len(decoded)
+        return decoded
+
+    @staticmethod
+    def decode_reply(reply):
+        """
+        decompresses the content of reply (QgsNetworkReplyContent) in place, returns
+        tuple with the number of bytes received and after decompression
+        """
+        content = reply.content()
+        nr_of_bytes = len(content)
+        content_encoding = bytes(reply.rawHeader(b"Content-Encoding")).decode(
+            "ascii", "ignore"
+        )
+        if content_encoding.strip().lower() in ("", "identity"):
+            return nr_of_bytes, nr_of_bytes
+        decoded = decode_content(bytes(content), content_encoding)
+        reply.setContent(QByteArray(decoded))
+        return nr_of_bytes, len(decoded)
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        """
+        Returns the shared thread pool with HTTP_MAX_WORKERS threads for concurrent
+        requests, the worker threads (and so their connections) are reused by
+        subsequent calls. Threads are only started when needed.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=HTTP_MAX_WORKERS, thread_name_prefix="pdok-http"
+                )
+            return self._executor
+
+    def shutdown(self):
+        """stops the worker threads, call when the plugin is unloaded"""
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def snapshot(self) -> dict:
+        """returns the counters, to pass to statistics to get the numbers since now"""
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "retries": self._retries,
+                "bytes": self._bytes,
+                "bytes_decoded": self._bytes_decoded,
+                "connection_setups": self._connection_setups,
+            }
+
+    def statistics(self, since: dict = None) -> dict:
+        """
+        Returns dict with requests, retries, bytes (received), bytes_decoded (after
+        decompression), connection_setups, average_latency and p95_latency (seconds,
+        None without requests), since snapshot since or since the start
+        """
+        with self._lock:
+            stats = {
+                "requests": self._requests,
+                "retries": self._retries,
+                "bytes": self._bytes,
+                "bytes_decoded": self._bytes_decoded,
+                "connection_setups": self._connection_setups,
+            }
+            if since is not None:
+                for key in stats:
+                    stats[key] -= since[key]
+            nr_of_latencies = min(stats["requests"], len(self._latencies))
+            latencies = sorted(
+                list(self._latencies)[len(self._latencies) - nr_of_latencies :]
+            )
+        stats["average_latency"] = None
+        stats["p95_latency"] = None
+        if len(latencies) > 0:
+            stats["average_latency"] = sum(latencies) / len(latencies)
+            stats["p95_latency"] = latencies[
+                min(len(latencies) - 1, int(0.95 * len(latencies)))
+            ]
+        return stats
+
+    def statistics_message(self, since: dict = None) -> str:
+        stats = self.statistics(since)
+        message = f"HTTP client: {stats['requests']} requests ({stats['retries']} retries), {stats['bytes']} bytes received"
+        if stats["bytes_decoded"] > stats["bytes"]:
+            saved = 1 - stats["bytes"] / stats["bytes_decoded"]
+            message = f"{message} ({stats['bytes_decoded']} bytes decompressed, {saved:.0%} saved by compression)"
+        message = f"{message}, {stats['connection_setups']} connection setups"
+        if stats["average_latency"] is not None:
+            message = f"{message}, average latency {stats['average_latency'] * 1000:.0f} ms, p95 latency {stats['p95_latency'] * 1000:.0f} ms"
+        return message
+
+
+_http_client = HttpClient()
+
+
+def get_http_client() -> HttpClient:
+    return _http_client
+
+
+@profiled("get_reply")
+def get_reply(url, feedback=None, headers: dict = None):
+    """
+    When a QgsFeedback is passed, the request is aborted when the feedback is
+    canceled, and PdokServicesCancelledException is raised.
+    """
+    return get_http_client().get(url, feedback, headers)
+
+
+def get_async_reply(url) -> QNetworkReply:
+    """
+    Starts a non-blocking GET request for url with the QGIS network access manager
+    and returns the QNetworkReply, connect to its finished signal to handle the
+    response (with read_async_reply, check_reply and get_content_type). The request
+    can be aborted with reply.abort().
+    """
+    return get_http_client().get_async(url)
+
+
+def read_async_reply(reply) -> bytes:
+    """
+    returns the content of a finished reply of get_async_reply, the request is
+    counted in the statistics of the HTTP client
+    """
+    return get_http_client().read_async_reply(reply)
+
+
+def check_reply(reply):
+    """raises PdokServicesNetworkException when reply has an error"""
     reply_err = reply.error()
     if reply_err != QNetworkReply.NetworkError.NoError:
         status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
@@ -30,45 +523,200 @@ def get_reply(url):
         reply_error_message = f"{reply.errorString()}{message}"
         raise PdokServicesNetworkException(reply_error_message)
 
-    return reply
 
+def get_validators(reply):
+    """returns tuple with the ETag and Last-Modified headers of reply, None if absent"""
+    etag = bytes(reply.rawHeader(b"ETag")).decode("latin-1").strip()
+    last_modified = bytes(reply.rawHeader(b"Last-Modified")).decode("latin-1").strip()
+    return etag or None, last_modified or None
+
+
+def get_conditional_headers(etag, last_modified) -> dict:
+    """returns the request headers to revalidate a response with etag and last_modified"""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def get_cached_response(url, cache=None, feedback=None):
+    """
+    Returns tuple (content, content_type, validators) of the response for url.
+
+    When a ResponseCache is passed, a cached response that is not expired is
+    returned without a request. An expired cached response with validators (ETag or
+    Last-Modified) is revalidated with a conditional request, and reused when the
+    service answers 304 (Not Modified), so the document is not downloaded again.
+
+    validators is None when the content is taken from the cache, else the tuple
+    (etag, last_modified) of the response, pass it to ResponseCache.put to store the
+    response once the content is checked.
+    """
+    stale = None
+    if cache is not None:
+        cached = cache.get(url)
+        if cached is not None:
+            content, content_type = cached
+            return content, content_type, None
+        stale = cache.get_stale(url)
+    headers = None
+    if stale is not None:
+        headers = get_conditional_headers(stale[2], stale[3])
+    reply = get_reply(url, feedback, headers)
+    status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+    if stale is not None and status_code == 304:
+        cache.refresh(url)
+        content, content_type, _, _ = stale
+        return content, content_type, None
+    return bytes(reply.content()), get_content_type(reply), get_validators(reply)
 
-def get_request_bytes(url, expected_content_type: str = None) -> bytes:
-    reply = get_reply(url)
+
+def get_request_bytes(
+    url, expected_content_type: str = None, cache=None, feedback=None
+) -> bytes:
+    """
+    When a ResponseCache is passed the response is taken from the cache when
+    available (see get_cached_response), else the response is stored in the cache.
+    """
+    content, content_type, validators = get_cached_response(url, cache, feedback)
+    if validators is None:
+        return content
 
     if expected_content_type:
-        content_type = str(reply.rawHeader(b"Content-Type"), encoding="utf-8")
         if content_type != expected_content_type:
             raise Exception(
                 f"unexpected Content-Type of response {content_type}, expected Content-Type {expected_content_type}. Request url: {url}"
             )
-    result = bytes(reply.content())
-    return result
+    if cache is not None:
+        cache.put(url, content, content_type, *validators)
+    return content
 
 
-def get_request_text(url) -> str:
-    reply = get_reply(url)
-    content_type = bytes(reply.rawHeader(b"Content-Type")).decode(
+def get_content_type(reply) -> str:
+    return bytes(reply.rawHeader(b"Content-Type")).decode(
         "ascii"
     )  # https://stackoverflow.com/a/4410331
-    encoding = "utf-8"
-    if len(content_type.split(";")) > 1:
-        encoding = content_type.split(";")[1].replace("charset=", "")
-    content_str = str(reply.content(), encoding)
+
+
+def get_charset(content_type: str) -> str:
+    """returns the (lowercased) charset parameter of content_type, utf-8 when absent"""
+    for parameter in content_type.split(";")[1:]:
+        name, _, value = parameter.partition("=")
+        if name.strip().lower() == "charset" and value.strip():
+            return value.strip().strip('"').lower()
+    return "utf-8"
+
+
+def is_utf8(charset: str) -> bool:
+    return charset.replace("-", "").replace("_", "") == "utf8"
+
+
+def get_request_text(url, feedback=None) -> str:
+    reply = get_reply(url, feedback)
+    content_type = get_content_type(reply)
+    content_str = str(reply.content(), get_charset(content_type))
     return content_str
 
 
-def get_request_json(url):
-    reply = get_reply(url)
-    content_type = bytes(reply.rawHeader(b"Content-Type")).decode(
-        "ascii"
-    )  # https://stackoverflow.com/a/4410331
-    encoding = "utf-8"
-    if len(content_type.split(";")) > 1:
-        encoding = content_type.split(";")[1].replace("charset=", "")
-    content_str = str(reply.content(), encoding)
+def parse_json_content(content: bytes, content_type: str, path=None):
+    """
+    Returns the decoded json content. UTF-8 content (the default for JSON) is parsed
+    directly from the bytes, without decoding it into a str first.
+
+    When path (sequence of keys) is passed, only the value at path is returned, for
+    example ("response", "docs") for the docs of a Locatieserver response, so the
+    rest of the document is released right away.
+    """
     if not content_type.startswith("application/json"):
         raise ValueError(
             f"Received Content-Type:{content_type}  expected Content-Type:application/json"
         )
-    return json.loads(content_str)
+    charset = get_charset(content_type)
+    if is_utf8(charset):
+        result = json.loads(content)
+    else:
+        result = json.loads(str(content, charset))
+    for key in path or ():
+        result = result[key]
+    return result
+
+
+@profiled("get_request_json")
+def get_request_json(url, cache=None, feedback=None, path=None):
+    """
+    Returns the decoded json response for url, or the value at path in it (see
+    parse_json_content). When a ResponseCache is passed the response is taken from
+    the cache when available (see get_cached_response), else the response is stored
+    in the cache.
+    """
+    content, content_type, validators = get_cached_response(url, cache, feedback)
+    with profile_stage("JSON decode"):
+        result = parse_json_content(content, content_type, path)
+    if cache is not None and validators is not None:
+        cache.put(url, content, content_type, *validators)
+    return result
+
+
+_END_OF_ITEMS = object()
+
+
+def imap_ordered(func, items, max_workers=1, feedback=None):
+    """
+    Generator that calls func for each item in items, with at most max_workers calls
+    (up to HTTP_MAX_WORKERS) running concurrently in the worker threads of the shared
+    pool, so the network round-trips of the requests done by func overlap. Results
+    are yielded in the order of items.
+
+    When feedback is canceled no new calls are started and the generator stops.
+    Exceptions raised by func are re-raised when the corresponding result is yielded.
+    """
+
+    def is_canceled():
+        return feedback is not None and feedback.isCanceled()
+
+    if max_workers <= 1:
+        for item in items:
+            if is_canceled():
+                return
+            yield func(item)
+        return
+
+    max_workers = min(max_workers, HTTP_MAX_WORKERS)
+    executor = get_http_client().get_executor()
+    # stages timed in the workers count for the profiler of the calling thread
+    func = bind_profiler(func)
+    items = iter(items)
+    exhausted = False
+    pending = deque()
+    try:
+        while True:
+            if is_canceled():
+                return
+            running = [future for future in pending if not future.done()]
+            # the pool is shared, so limit the calls of this generator that are not
+            # done to max_workers. Keep at most 2 * max_workers results waiting for
+            # an earlier item, so a large input does not end up in memory as
+            # futures all at once
+            while (
+                not exhausted
+                and len(running) < max_workers
+                and len(pending) < 2 * max_workers
+            ):
+                item = next(items, _END_OF_ITEMS)
+                if item is _END_OF_ITEMS:
+                    exhausted = True
+                    break
+                future = executor.submit(func, item)
+                pending.append(future)
+                running.append(future)
+            if not pending:
+                return
+            if pending[0].done():
+                yield pending.popleft().result()
+            else:
+                wait(running, return_when=FIRST_COMPLETED)
+    finally:
+        for future in pending:
+            future.cancel()
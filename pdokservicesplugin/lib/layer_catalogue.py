@@ -0,0 +1,232 @@
+"""
+The layer catalogue of the plugin: all layers of the PDOK services, generated into
+resources/layers-pdok.json with scripts/generate-pdok-layers-config.sh.
+
+The json file is compiled into an indexed SQLite file (layers-pdok.sqlite) with
+scripts/compile-layers-pdok.py. The plugin opens that file read-only and memory
+mapped, and only reads the few columns needed to list the layers. The full layer
+record is materialized when a layer is selected. When there is no (up to date)
+compiled catalogue the json file is loaded instead. Whether the compiled catalogue is
+up to date is decided by the SHA-1 of the json file it was compiled from, stored in
+the catalogue, file modification times are not kept by git or the plugin installer.
+
+Note: this module should not depend on qgis, as it is also used by the build script.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import urllib.request
+
+# bump when the layout of the compiled catalogue changes, older files are ignored
+CATALOGUE_VERSION = 2
+
+# maximum number of bytes of the catalogue file sqlite maps into memory
+CATALOGUE_MMAP_SIZE = 256 * 1024 * 1024
+
+
+def get_styles_text(layer) -> str:
+    """returns the names and titles of the styles of layer as one string, for filtering"""
+    if "styles" not in layer:
+        return ""
+    return " ".join([" ".join(x.values()) for x in layer["styles"]])
+
+
+def get_layer_summary(index, layer) -> dict:
+    """returns dict with the fields of layer that are needed to list it in the dialog"""
+    return {
+        "index": index,
+        "name": layer["name"],
+        "service_type": layer["service_type"],
+        "title": layer["title"],
+        "service_title": layer["service_title"],
+        "service_abstract": layer["service_abstract"],
+        "styles_text": get_styles_text(layer),
+    }
+
+
+def get_source_hash(json_path) -> str:
+    """returns the SHA-1 (hex) of the json file, to check if a catalogue is current"""
+    with open(json_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def compile_catalogue(json_path, db_path):
+    """compiles the layer catalogue in json_path into a SQLite file db_path"""
+    with open(json_path, "rb") as f:
+        content = f.read()
+    layers = json.loads(content)
+    tmp_path = f"{db_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute(
+            """
+            CREATE TABLE layers (
+                idx INTEGER PRIMARY KEY,
+                name TEXT,
+                service_md_id TEXT,
+                service_type TEXT NOT NULL,
+                title TEXT,
+                service_title TEXT,
+                service_abstract TEXT,
+                styles_text TEXT NOT NULL,
+                record TEXT NOT NULL
+            )
+            """
+        )
+        connection.executemany(
+            "INSERT INTO layers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    index,
+                    layer["name"] if isinstance(layer["name"], str) else None,
+                    layer.get("service_md_id"),
+                    layer["service_type"],
+                    layer["title"],
+                    layer["service_title"],
+                    layer["service_abstract"],
+                    get_styles_text(layer),
+                    json.dumps(layer, ensure_ascii=False, separators=(",", ":")),
+                )
+                for index, layer in enumerate(layers)
+            ),
+        )
+        connection.execute(
+            "CREATE INDEX layers_service_md_id_name ON layers (service_md_id, name)"
+        )
+        connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "INSERT INTO meta VALUES ('source_sha1', ?)",
+            (hashlib.sha1(content).hexdigest(),),
+        )
+        connection.execute(f"PRAGMA user_version = {CATALOGUE_VERSION}")
+        connection.commit()
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+    os.replace(tmp_path, db_path)
+    return len(layers)
+
+
+class LayerCatalogue:
+    """
+    Layer catalogue backed by a compiled (SQLite) catalogue file, see compile_catalogue
+    """
+
+    def __init__(self, db_path):
+        self.path = db_path
+        uri = f"file:{urllib.request.pathname2url(db_path)}?mode=ro&immutable=1"
+        self._connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._connection.execute(f"PRAGMA mmap_size = {CATALOGUE_MMAP_SIZE}")
+
+    @staticmethod
+    def is_compiled_from(db_path, json_path) -> bool:
+        """
+        returns True when db_path is a catalogue of CATALOGUE_VERSION compiled from
+        the current json_path (or json_path does not exist)
+        """
+        connection = sqlite3.connect(
+            f"file:{urllib.request.pathname2url(db_path)}?mode=ro", uri=True
+        )
+        try:
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version != CATALOGUE_VERSION:
+                return False
+            if not os.path.exists(json_path):
+                return True
+            row = connection.execute(
+                "SELECT value FROM meta WHERE key = 'source_sha1'"
+            ).fetchone()
+            return row is not None and row[0] == get_source_hash(json_path)
+        finally:
+            connection.close()
+
+    def __len__(self):
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM layers").fetchone()
+        return count
+
+    def summaries(self):
+        """yields the layer summaries (see get_layer_summary) of the listable layers"""
+        cursor = self._connection.execute(
+            """
+            SELECT idx, name, service_type, title, service_title, service_abstract, styles_text
+            FROM layers WHERE name IS NOT NULL ORDER BY idx
+            """
+        )
+        for row in cursor:
+            yield dict(
+                zip(
+                    (
+                        "index",
+                        "name",
+                        "service_type",
+                        "title",
+                        "service_title",
+                        "service_abstract",
+                        "styles_text",
+                    ),
+                    row,
+                )
+            )
+
+    def get_layer(self, index) -> dict:
+        """returns the full layer record with index, None when not found"""
+        row = self._connection.execute(
+            "SELECT record FROM layers WHERE idx = ?", (index,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def find_layers(self, service_md_id, name) -> "list[dict]":
+        """returns the full layer records with service_md_id and name"""
+        cursor = self._connection.execute(
+            "SELECT record FROM layers WHERE service_md_id = ? AND name = ? ORDER BY idx",
+            (service_md_id, name),
+        )
+        return [json.loads(record) for (record,) in cursor]
+
+
+class JsonLayerCatalogue:
+    """
+    Layer catalogue read from the layers-pdok.json file, fallback when there is no
+    compiled catalogue. Has the same interface as LayerCatalogue.
+    """
+
+    def __init__(self, json_path):
+        self.path = json_path
+        with open(json_path, "r", encoding="utf-8") as f:
+            self._layers = json.load(f)
+
+    def __len__(self):
+        return len(self._layers)
+
+    def summaries(self):
+        for index, layer in enumerate(self._layers):
+            if isinstance(layer["name"], str):
+                yield get_layer_summary(index, layer)
+
+    def get_layer(self, index) -> dict:
+        if 0 <= index < len(self._layers):
+            return dict(self._layers[index])
+        return None
+
+    def find_layers(self, service_md_id, name) -> "list[dict]":
+        return [
+            dict(layer)
+            for layer in self._layers
+            if layer.get("service_md_id") == service_md_id and layer["name"] == name
+        ]
+
+
+def open_layer_catalogue(json_path, db_path):
+    """
+    Returns LayerCatalogue for db_path when it is compiled from the current
+    json_path, else JsonLayerCatalogue for json_path
+    """
+    if os.path.exists(db_path) and LayerCatalogue.is_compiled_from(db_path, json_path):
+        return LayerCatalogue(db_path)
+    return JsonLayerCatalogue(json_path)
@@ -0,0 +1,211 @@
+import bisect
+import math
+import re
+
+from qgis.PyQt.QtCore import Qt, QAbstractProxyModel, QSortFilterProxyModel
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# weight of a word found in a field of a layer, so a hit in the title counts more
+# than a hit in the abstract
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "title": 3.0,
+    "service_title": 2.0,
+    "service_type": 1.0,
+    "styles": 1.0,
+    "service_abstract": 0.5,
+}
+# a query word that is only a prefix of a word in the layer counts less than a
+# complete word
+PREFIX_MATCH_FACTOR = 0.5
+# added to the score when the query (or one of its words) is the layer name
+NAME_MATCH_BOOST = 10.0
+# added to the score when a query word is the service type of the layer (wms, wfs..)
+SERVICE_TYPE_MATCH_BOOST = 2.0
+
+
+def tokenize(text) -> "list[str]":
+    """
+    returns the lowercased words in text. Words with underscores (as in layer names
+    like actueel_ortho25) are returned as a whole and as their parts, so both
+    "actueel_ortho25" and "ortho25" match
+    """
+    tokens = []
+    for word in WORD_PATTERN.findall(str(text).lower()):
+        parts = [part for part in word.split("_") if part]
+        tokens.extend(parts)
+        if len(parts) > 1:
+            tokens.append(word)
+    return tokens
+
+
+class LayerSearchIndex:
+    """
+    Inverted index over the searchable fields of the layers in the layer model, so
+    searching does not have to scan the text of every row.
+
+    search matches rows that contain all words of the query, in any order, where the
+    last characters of a word may be missing (prefix match). Matching rows are scored
+    with the field weights of the words (FIELD_WEIGHTS) and the inverse document
+    frequency of the words, plus a boost for matching layer name and service type.
+    """
+
+    def __init__(self):
+        # token -> {row: weight}, weight is the sum of the weights of the fields of
+        # the row containing the token
+        self._postings = {}
+        self._names = {}  # row -> lowercased layer name
+        self._service_types = {}  # row -> set of service type tokens
+        self._terms = None  # sorted tokens, for prefix lookups
+        self._idf = None  # token -> inverse document frequency
+        self._prefix_terms = {}  # prefix -> tokens starting with prefix
+        self._prefix_rows = {}  # prefix -> set of rows, cache of _get_prefix_rows
+
+    def add(self, row, fields):
+        """adds row with fields (dict with field name (see FIELD_WEIGHTS) and text)"""
+        for field, text in fields.items():
+            tokens = tokenize(text)
+            if len(tokens) == 0:
+                continue
+            field_weight = FIELD_WEIGHTS.get(field, 1.0)
+            term_frequencies = {}
+            for token in tokens:
+                term_frequencies[token] = term_frequencies.get(token, 0) + 1
+            for token, tf in term_frequencies.items():
+                weights = self._postings.setdefault(token, {})
+                weights[row] = weights.get(row, 0.0) + field_weight * (1 + math.log(tf))
+        self._names[row] = str(fields.get("name", "")).lower()
+        self._service_types[row] = set(tokenize(fields.get("service_type", "")))
+        self._terms = None
+        self._idf = None
+        self._prefix_terms = {}
+        self._prefix_rows = {}
+
+    def _update_statistics(self):
+        if self._terms is not None:
+            return
+        self._terms = sorted(self._postings)
+        nr_of_rows = len(self._names)
+        self._idf = {
+            token: math.log(1 + nr_of_rows / len(weights))
+            for token, weights in self._postings.items()
+        }
+
+    def _get_prefix_terms(self, prefix) -> "list[str]":
+        """returns the tokens starting with prefix"""
+        terms = self._prefix_terms.get(prefix)
+        if terms is not None:
+            return terms
+        self._update_statistics()
+        terms = []
+        for i in range(bisect.bisect_left(self._terms, prefix), len(self._terms)):
+            if not self._terms[i].startswith(prefix):
+                break
+            terms.append(self._terms[i])
+        self._prefix_terms[prefix] = terms
+        return terms
+
+    def _get_prefix_rows(self, prefix) -> set:
+        """returns the rows containing a token starting with prefix"""
+        rows = self._prefix_rows.get(prefix)
+        if rows is not None:
+            return rows
+        rows = set()
+        for term in self._get_prefix_terms(prefix):
+            rows.update(self._postings[term])
+        self._prefix_rows[prefix] = rows
+        return rows
+
+    def _score_token(self, token, rows, scores):
+        """adds the score of query word token to scores of rows"""
+        for term in self._get_prefix_terms(token):
+            factor = self._idf[term]
+            if term != token:
+                factor *= PREFIX_MATCH_FACTOR
+            weights = self._postings[term]
+            if len(weights) < len(rows):
+                matches = ((row, w) for row, w in weights.items() if row in rows)
+            else:
+                matches = ((row, weights[row]) for row in rows if row in weights)
+            for row, weight in matches:
+                scores[row] += weight * factor
+
+    def search(self, query):
+        """
+        returns dict with the rows matching all words in query and their score,
+        None when the query has no words (so all rows match)
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if len(tokens) == 0:
+            return None
+        # start with the most selective word, so the intersections stay small
+        row_sets = sorted((self._get_prefix_rows(token) for token in tokens), key=len)
+        rows = set(row_sets[0])
+        for row_set in row_sets[1:]:
+            rows &= row_set
+            if not rows:
+                return {}
+
+        scores = dict.fromkeys(rows, 0.0)
+        for token in tokens:
+            self._score_token(token, rows, scores)
+        query_name = query.strip().lower()
+        token_set = set(tokens)
+        for row in rows:
+            name = self._names[row]
+            if name == query_name or name in token_set:
+                scores[row] += NAME_MATCH_BOOST
+            if token_set & self._service_types[row]:
+                scores[row] += SERVICE_TYPE_MATCH_BOOST
+        return scores
+
+
+class LayerSearchProxyModel(QSortFilterProxyModel):
+    """
+    Proxy model accepting only the source rows with a score (for example the result
+    of LayerSearchIndex.search), sorted on score with the best first. All rows in
+    source order when the scores are None.
+
+    The scores are keyed on the rows of the layer model, the model at the bottom of
+    the chain of proxy models: the source model can be another proxy model (like the
+    style filter of the dialog), its indexes are mapped to the layer model.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._scores = None
+
+    def set_row_scores(self, scores):
+        self._scores = scores
+        if scores is None:
+            self.sort(-1)  # source order
+        else:
+            self.sort(0, Qt.SortOrder.DescendingOrder)
+        # sort() is a no-op when the sort column and order do not change
+        self.invalidate()
+
+    def get_layer_row(self, source_index) -> int:
+        """returns the row in the layer model of source_index of the source model"""
+        model = self.sourceModel()
+        while isinstance(model, QAbstractProxyModel):
+            source_index = model.mapToSource(source_index)
+            model = model.sourceModel()
+        return source_index.row()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._scores is None:
+            return True
+        source_index = self.sourceModel().index(source_row, 0, source_parent)
+        return self.get_layer_row(source_index) in self._scores
+
+    def lessThan(self, source_left, source_right):
+        left_row = self.get_layer_row(source_left)
+        right_row = self.get_layer_row(source_right)
+        if self._scores is None:
+            return left_row < right_row
+        # on equal score the first row in the layer model comes first
+        return (self._scores.get(left_row, 0.0), -left_row) < (
+            self._scores.get(right_row, 0.0),
+            -right_row,
+        )
@@ -5,8 +5,13 @@ import urllib.parse
 from osgeo import ogr
 
 from .http_client import get_request_json
+from .profiling import profiled
+from .response_cache import get_response_cache
+from .suggest_cache import get_suggest_cache
 
 SERVICE_ENDPOINT = "https://api.pdok.nl/bzk/locatieserver/search/v3_1"
+# path of the docs in a Locatieserver response, see parse_json_content
+RESPONSE_DOCS = ("response", "docs")
 
 
 class Projection(Enum):
@@ -91,14 +96,47 @@ def url_encode_query_string(query_string):
     return urllib.parse.quote(query_string)
 
 
+def get_fields_filter(fields, proj: Projection = None, geometry=False) -> str:
+    """
+    Returns the url encoded value for the fl parameter, requesting fields and the
+    id field. When proj is passed the centroid field for proj is added, and when
+    geometry is True also the geometry field for proj. So only the geometry column
+    of the requested projection is downloaded.
+    """
+    fl = ["id", *fields]
+    if proj is not None:
+        geom_suffix = proj_mapping[proj]
+        fl.append(f"centroide{geom_suffix}")
+        if geometry:
+            fl.append(f"geometrie{geom_suffix}")
+    fl = list(dict.fromkeys(fl))  # remove duplicates, keeping order
+    return url_encode_query_string(",".join(fl))
+
+
+def get_suggest_url(
+    query,
+    type_filter=TypeFilter.new_with_default_values(),
+    rows=10,
+    fields=None,
+) -> str:
+    query = url_encode_query_string(query)
+    query_string = f"q={query}&rows={rows}&fq={type_filter}"
+    if fields is not None:
+        query_string = f"{query_string}&fl={get_fields_filter(fields)}"
+    return f"{SERVICE_ENDPOINT}/suggest?{query_string}"
+
+
 def suggest_query(
     query,
     type_filter=TypeFilter.new_with_default_values(),
     rows=10,
+    fields=None,
+    feedback=None,
 ) -> "list[dict]":
     """
 
-    Returns list of dict with fields: type, weergavenaam, id score
+    Returns list of dict with fields: type, weergavenaam, id score (or id and the
+    requested fields when fields is passed)
     For example:
         {
             "type": "gemeente",
@@ -106,17 +144,18 @@ def suggest_query(
             "id": "gem-0b2a8b92856b27f86fbd67ab35808ebf",
             "score": 19.91312
         }
-    Raises PdokServicesNetworkException when request fails
+    Raises PdokServicesNetworkException when request fails, and
+    PdokServicesCancelledException when feedback is canceled
     """
     if len(type_filter.types) == 0:
         return []
-    # TODO: add fields filter, with fl=id,geometrie_ll/rd or *
-    query = url_encode_query_string(query)
-    query_string = f"q={query}&rows={rows}&fq={type_filter}"
-    url = f"{SERVICE_ENDPOINT}/suggest?{query_string}"
-    content_obj = get_request_json(url)
-    result = content_obj["response"]["docs"]
-    return result
+    suggest_cache = get_suggest_cache()
+    result = suggest_cache.get(query, type_filter, rows, fields)
+    if result is not None:
+        return result
+    url = get_suggest_url(query, type_filter, rows, fields)
+    content_obj = get_request_json(url, get_response_cache(), feedback)
+    return suggest_cache.put(query, type_filter, rows, fields, content_obj)
 
 
 def convert_to_geojson(result_item, proj: Projection):
@@ -159,6 +198,7 @@ def remove_redundant_geom_fields(result_item, proj: Projection):
     return result_item
 
 
+@profiled("process_geom_fields")
 def process_geom_fields(result_item, proj: Projection):
     geoms = get_the_geom(result_item, proj)
     result_item = remove_redundant_geom_fields(result_item, proj)
@@ -167,53 +207,94 @@ def process_geom_fields(result_item, proj: Projection):
 
 
 def free_query(
-    query, proj: Projection, type_filter=TypeFilter.new_with_default_values(), rows=10
+    query,
+    proj: Projection,
+    type_filter=TypeFilter.new_with_default_values(),
+    rows=10,
+    fields=None,
+    feedback=None,
 ) -> "list[dict]":
     """
-    Raises PdokServicesNetworkException when request fails
+    When fields is passed, only the id, the requested fields and the centroid
+    for proj are retrieved (include "score" in fields to get the score),
+    else the default fields of the free endpoint.
+
+    Raises PdokServicesNetworkException when request fails, and
+    PdokServicesCancelledException when feedback is canceled
     """
     query = url_encode_query_string(query)
     query_string = f"q={query}&rows={rows}"
+    if fields is not None:
+        query_string = f"{query_string}&fl={get_fields_filter(fields, proj)}"
     url = f"{SERVICE_ENDPOINT}/free?{query_string}&fq={type_filter}"
-    content_obj = get_request_json(url)
-
-    result = content_obj["response"]["docs"]
+    result = get_request_json(url, get_response_cache(), feedback, RESPONSE_DOCS)
     filter_result = [process_geom_fields(item, proj) for item in result]
     return filter_result
 
 
 def reverse_lookup(
-    x, y, fields, type_filter=TypeFilter.new_with_default_values()
+    x, y, fields, type_filter=TypeFilter.new_with_default_values(), feedback=None
 ) -> "list[dict]":
     """
     Reverse geocoder lookup, x and y coordinates in EPSG:28992
 
-    Raises PdokServicesNetworkException when request fails
+    Raises PdokServicesNetworkException when request fails, and
+    PdokServicesCancelledException when feedback is canceled
     """
     rev_geo_type_filter = type_filter.rev_geo_filter()
-    fields_query_string = url_encode_query_string(",".join(fields))
+    fields_query_string = get_fields_filter(fields)
     url = f"{SERVICE_ENDPOINT}/reverse?X={x}&Y={y}&{rev_geo_type_filter}&fl={fields_query_string}"  # {rev_geo_type_filter}
-    content_obj = get_request_json(url)
-    result = content_obj["response"]["docs"]
-    return result
+    return get_request_json(url, get_response_cache(), feedback, RESPONSE_DOCS)
 
 
-def get_lookup_object_url(object_id: str) -> str:
+def get_lookup_object_url(object_id: str, proj: Projection = None, fields=None) -> str:
     object_id = url_encode_query_string(object_id)
-    query_string = f"id={object_id}&fl=*"  # return all fields with fl=*
+    fl = "*"  # return all fields with fl=*
+    if fields is not None:
+        fl = get_fields_filter(fields, proj, geometry=True)
+    query_string = f"id={object_id}&fl={fl}"
     url = f"{SERVICE_ENDPOINT}/lookup?{query_string}"
     return url
 
 
-def lookup_object(object_id: str, proj: Projection) -> dict:
+def lookup_object(object_id: str, proj: Projection, fields=None, feedback=None) -> dict:
     """
-    Raises PdokServicesNetworkException when request fails
+    When fields is passed, only the id, the requested fields and the centroid and
+    geometry for proj are retrieved, else all fields.
+
+    Raises PdokServicesNetworkException when request fails, and
+    PdokServicesCancelledException when feedback is canceled
     """
-    # TODO: add fields filter, with fl=id,geometrie_ll/rd or fl=*
-    url = get_lookup_object_url(object_id)
-    content_obj = get_request_json(url)
-    if content_obj["response"]["numFound"] != 1:
+    url = get_lookup_object_url(object_id, proj, fields)
+    response = get_request_json(url, get_response_cache(), feedback, ("response",))
+    if response["numFound"] != 1:
         return None
-    result = content_obj["response"]["docs"][0]
+    result = response["docs"][0]
     filter_result = process_geom_fields(result, proj)
     return filter_result
+
+
+def lookup_objects(
+    object_ids: "list[str]", proj: Projection, fields=("type",), feedback=None
+) -> "dict[str, dict]":
+    """
+    Lookup multiple objects in one request, by filtering the free endpoint on the
+    object ids. Only the id, the requested fields and the centroid and geometry for
+    proj are retrieved.
+
+    Returns dict with the object id as key, ids not found are not in the dict.
+    Keep the number of ids moderate (for example 50), since they are all part of the
+    request url.
+
+    Raises PdokServicesNetworkException when request fails, and
+    PdokServicesCancelledException when feedback is canceled
+    """
+    if len(object_ids) == 0:
+        return {}
+    ids_filter = " OR ".join([f'"{object_id}"' for object_id in object_ids])
+    fq = url_encode_query_string(f"id:({ids_filter})")
+    fl = get_fields_filter(fields, proj, geometry=True)
+    query_string = f"q=*:*&rows={len(object_ids)}&fq={fq}&fl={fl}"
+    url = f"{SERVICE_ENDPOINT}/free?{query_string}"
+    result = get_request_json(url, get_response_cache(), feedback, RESPONSE_DOCS)
+    return {item["id"]: process_geom_fields(item, proj) for item in result}
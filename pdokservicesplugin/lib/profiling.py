@@ -0,0 +1,147 @@
+import contextlib
+import functools
+import threading
+import time
+
+from qgis.core import Qgis, QgsMessageLog
+
+from .constants import PLUGIN_NAME
+
+
+class Profiler:
+    """
+    Aggregates the time spent in the stages (network, JSON decoding, geometry
+    conversion..) of a processing run: the number of times each stage ran and the
+    total time. Stages run in worker threads are summed, so with concurrent requests
+    the total of a stage can exceed the wall time.
+
+    The active profiler is kept per thread, so processing runs in other threads
+    (processing algorithms run as parallel background tasks) are not timed in it.
+    Worker threads doing calls for the run get the profiler with bind_profiler.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self._stages = {}  # name -> [count, seconds]
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, count=1):
+        with self._lock:
+            stage = self._stages.setdefault(name, [0, 0.0])
+            stage[0] += count
+            stage[1] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def statistics(self) -> "dict[str, tuple[int, float]]":
+        """returns dict with stage name and tuple (count, seconds) of each stage"""
+        with self._lock:
+            return {name: tuple(stage) for name, stage in self._stages.items()}
+
+    def summary(self) -> str:
+        """returns table with count, total and mean time of the stages"""
+        wall_time = time.perf_counter() - self.start_time
+        lines = [
+            f"Profile (wall time {wall_time:.3f} s, stages in worker threads are summed):",
+            f"{'stage':<32} {'count':>9} {'total (s)':>10} {'mean (ms)':>10}",
+        ]
+        stages = sorted(self.statistics().items(), key=lambda x: x[1][1], reverse=True)
+        for name, (count, seconds) in stages:
+            mean = seconds / count * 1000 if count > 0 else 0.0
+            lines.append(f"{name:<32} {count:>9} {seconds:>10.3f} {mean:>10.3f}")
+        return "\n".join(lines)
+
+
+_local = threading.local()
+_null_context = contextlib.nullcontext()
+
+
+def start_profiling() -> Profiler:
+    """
+    starts profiling in the current thread, until stop_profiling the stages of the
+    plugin code run by this thread are timed in the returned Profiler
+    """
+    profiler = Profiler()
+    _local.profiler = profiler
+    return profiler
+
+
+def stop_profiling(profiler: Profiler):
+    if get_profiler() is profiler:
+        _local.profiler = None
+
+
+def get_profiler() -> Profiler:
+    """returns the active Profiler of the current thread, None when not profiling"""
+    return getattr(_local, "profiler", None)
+
+
+def bind_profiler(func):
+    """
+    returns func, wrapped to run with the active Profiler of the calling thread when
+    profiling, pass the result to the worker threads that call it
+    """
+    profiler = get_profiler()
+    if profiler is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = get_profiler()
+        _local.profiler = profiler
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.profiler = previous
+
+    return wrapper
+
+
+def add_stage(name, seconds, count=1):
+    """adds count runs of stage name taking seconds in total, when profiling"""
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.add(name, seconds, count)
+
+
+def profile_stage(name):
+    """
+    returns context manager timing its block as stage name, when profiling, so
+    the overhead is a function call when not profiling
+    """
+    profiler = get_profiler()
+    if profiler is None:
+        return _null_context
+    return profiler.stage(name)
+
+
+def profiled(name):
+    """decorator timing calls of the decorated function as stage name, see profile_stage"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = get_profiler()
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def report_profile(profiler: Profiler, feedback, tool_name):
+    """pushes the summary of profiler to feedback and the QGIS message log"""
+    summary = profiler.summary()
+    feedback.pushInfo(summary)
+    QgsMessageLog.logMessage(
+        f"{tool_name}\n{summary}", PLUGIN_NAME, Qgis.MessageLevel.Info
+    )
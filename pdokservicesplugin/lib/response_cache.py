@@ -0,0 +1,288 @@
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from qgis.core import QgsApplication
+
+from .constants import (
+    PLUGIN_ID,
+    RESPONSE_CACHE_MAX_SIZE,
+    RESPONSE_CACHE_MAX_STALE,
+    RESPONSE_CACHE_TTL,
+)
+
+
+class ResponseCache:
+    """
+    Persistent cache for HTTP response bodies, stored in a SQLite database. Entries
+    are keyed on the normalized request url.
+
+    Entries older than ttl (seconds) are not returned by get and removed on
+    eviction. Entries with validators (the ETag and Last-Modified headers of the
+    response) are kept for max_stale (seconds) after expiry, so they can be
+    revalidated with a conditional request instead of downloaded again, see
+    get_stale and refresh. When the total size of the cached responses exceeds
+    max_size (bytes) the least recently used entries are evicted.
+
+    The cache can be shared between threads, all database access is serialized with
+    a lock.
+    """
+
+    # run eviction after this many insertions, so not every put pays for it
+    EVICT_INTERVAL = 500
+    # version of the database schema, stored in PRAGMA user_version
+    SCHEMA_VERSION = 1
+
+    def __init__(
+        self,
+        db_path,
+        ttl=RESPONSE_CACHE_TTL,
+        max_size=RESPONSE_CACHE_MAX_SIZE,
+        max_stale=RESPONSE_CACHE_MAX_STALE,
+    ):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_stale = max_stale
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _get_connection(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    content BLOB NOT NULL,
+                    content_type TEXT,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+            self._migrate()
+            self._evict()
+        return self._connection
+
+    def _migrate(self):
+        """
+        Upgrades a database created by an earlier version of the plugin to
+        SCHEMA_VERSION, caller should hold the lock
+        """
+        connection = self._connection
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        if version >= self.SCHEMA_VERSION:
+            return
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(responses)")]
+        # version 1: validators of the response, for conditional requests
+        for column in ("etag", "last_modified"):
+            if column not in columns:
+                connection.execute(f"ALTER TABLE responses ADD COLUMN {column} TEXT")
+        connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    @staticmethod
+    def normalize_url(url):
+        """
+        Returns url with lowercased scheme and host and sorted query parameters,
+        so equivalent requests map to the same cache entry
+        """
+        parse_result = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qsl(parse_result.query, keep_blank_values=True)
+        query_string = urllib.parse.urlencode(sorted(query))
+        return urllib.parse.urlunsplit(
+            (
+                parse_result.scheme.lower(),
+                parse_result.netloc.lower(),
+                parse_result.path,
+                query_string,
+                "",
+            )
+        )
+
+    def get(self, url):
+        """
+        Returns tuple (content, content_type) for url, or None when url is not
+        cached or the cached response is expired
+        """
+        key = self.normalize_url(url)
+        now = time.time()
+        with self._lock:
+            connection = self._get_connection()
+            row = connection.execute(
+                "SELECT content, content_type FROM responses WHERE url = ? AND created > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute(
+                "UPDATE responses SET accessed = ? WHERE url = ?", (now, key)
+            )
+            self.hits += 1
+            return bytes(row[0]), row[1]
+
+    def get_stale(self, url):
+        """
+        Returns tuple (content, content_type, etag, last_modified) for url when an
+        entry with validators is cached, also when it is expired, None otherwise. Pass
+        the validators in a conditional request, and call refresh when the response
+        is not modified.
+        """
+        key = self.normalize_url(url)
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute(
+                    "SELECT content, content_type, etag, last_modified FROM responses WHERE url = ? AND (etag IS NOT NULL OR last_modified IS NOT NULL)",
+                    (key,),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        return bytes(row[0]), row[1], row[2], row[3]
+
+    def refresh(self, url):
+        """marks the entry of url as fresh again, after a successful revalidation"""
+        key = self.normalize_url(url)
+        now = time.time()
+        with self._lock:
+            self._get_connection().execute(
+                "UPDATE responses SET created = ?, accessed = ? WHERE url = ?",
+                (now, now, key),
+            )
+            self.revalidations += 1
+
+    def put(
+        self,
+        url,
+        content: bytes,
+        content_type: str = "",
+        etag: str = None,
+        last_modified: str = None,
+    ):
+        """
+        Stores the response for url, with the values of its ETag and Last-Modified
+        headers (when present) to revalidate the entry once it is expired
+        """
+        key = self.normalize_url(url)
+        now = time.time()
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (url, content, content_type, created, accessed, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    sqlite3.Binary(content),
+                    content_type,
+                    now,
+                    now,
+                    etag or None,
+                    last_modified or None,
+                ),
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        """
+        Removes expired entries (that cannot be revalidated or are expired longer
+        than max_stale) and least recently used entries exceeding max_size, caller
+        should hold the lock
+        """
+        connection = self._connection
+        expired = time.time() - self.ttl
+        connection.execute(
+            "DELETE FROM responses WHERE created <= ? AND ((etag IS NULL AND last_modified IS NULL) OR created <= ?)",
+            (expired, expired - self.max_stale),
+        )
+        (total_size,) = connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(content)), 0) FROM responses"
+        ).fetchone()
+        if total_size <= self.max_size:
+            return
+        surplus = total_size - self.max_size
+        evict_urls = []
+        for url, size in connection.execute(
+            "SELECT url, LENGTH(content) FROM responses ORDER BY accessed"
+        ):
+            evict_urls.append((url,))
+            surplus -= size
+            if surplus <= 0:
+                break
+        connection.executemany("DELETE FROM responses WHERE url = ?", evict_urls)
+
+    def evict(self):
+        with self._lock:
+            self._get_connection()
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._get_connection().execute("DELETE FROM responses")
+            self.hits = 0
+            self.misses = 0
+            self.revalidations = 0
+
+    def statistics(self) -> dict:
+        """
+        Returns dict with the hits, misses and revalidations (expired entries reused
+        after a conditional request) since the cache was opened and the number of
+        entries and total size (bytes) of the cache
+        """
+        with self._lock:
+            entries, size = (
+                self._get_connection()
+                .execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM responses"
+                )
+                .fetchone()
+            )
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "entries": entries,
+                "size": size,
+            }
+
+
+_response_caches = {}
+_response_cache_lock = threading.Lock()
+
+
+def get_cache_dir():
+    """
+    Returns the cache directory of the plugin in the current QGIS profile directory
+    """
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), "cache", PLUGIN_ID)
+
+
+def get_response_cache(name="responses", ttl=RESPONSE_CACHE_TTL) -> ResponseCache:
+    """
+    Returns the response cache with name, stored in {name}.sqlite in the cache
+    directory. The default cache is shared by all Locatieserver requests of the plugin.
+    """
+    with _response_cache_lock:
+        if name not in _response_caches:
+            _response_caches[name] = ResponseCache(
+                os.path.join(get_cache_dir(), f"{name}.sqlite"), ttl
+            )
+        return _response_caches[name]
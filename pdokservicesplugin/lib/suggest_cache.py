@@ -0,0 +1,129 @@
+import re
+import threading
+from collections import OrderedDict
+
+from .constants import SUGGEST_CACHE_SIZE
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# shortest query a cached result set is reused for (shorter queries are not sent)
+MIN_QUERY_LENGTH = 2
+
+
+def normalize_query(query) -> str:
+    """returns query lowercased and with whitespace collapsed"""
+    return " ".join(str(query).lower().split())
+
+
+class SuggestCache:
+    """
+    In-process LRU cache of Locatieserver suggest results, keyed on the normalized
+    query, the type filter and the requested fields. Shared by the locator filter,
+    the toolbar search and the dialog, so retyping (or backspacing to) a query does
+    not send a request again.
+
+    When a cached result set is complete (the service found no more documents than
+    it returned), the results of a longer query starting with the cached query are
+    taken from it: its documents are filtered on the words of the longer query.
+    """
+
+    def __init__(self, max_entries=SUGGEST_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (docs, rows, complete)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(query, type_filter, fields):
+        return (
+            normalize_query(query),
+            str(type_filter),
+            None if fields is None else tuple(fields),
+        )
+
+    @staticmethod
+    def matches(doc, tokens):
+        """true when every token is the start of a word of the weergavenaam of doc"""
+        words = TOKEN_PATTERN.findall(str(doc.get("weergavenaam", "")).lower())
+        return all(any(word.startswith(token) for word in words) for token in tokens)
+
+    def _store(self, key, docs, rows, complete):
+        """caller should hold the lock"""
+        self._entries[key] = (docs, rows, complete)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, query, type_filter, rows, fields=None):
+        """returns cached list of docs for the suggest query, or None when not cached"""
+        key = self.get_key(query, type_filter, fields)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                docs, cached_rows, complete = entry
+                if complete or cached_rows >= rows:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return docs[:rows]
+            docs = self._get_from_prefix(key, rows)
+            if docs is not None:
+                self.prefix_hits += 1
+                return docs
+            self.misses += 1
+            return None
+
+    def _get_from_prefix(self, key, rows):
+        """
+        returns the docs for key filtered from the complete result set of the longest
+        cached shorter query, None when there is none. Caller should hold the lock
+        """
+        query, type_filter, fields = key
+        if fields is not None and "weergavenaam" not in fields:
+            return None
+        tokens = TOKEN_PATTERN.findall(query)
+        for end in range(len(query) - 1, MIN_QUERY_LENGTH - 1, -1):
+            entry = self._entries.get((query[:end], type_filter, fields))
+            if entry is None or not entry[2]:
+                continue
+            docs = [doc for doc in entry[0] if self.matches(doc, tokens)]
+            if len(docs) == 0:
+                # the service might still find documents (matching on other fields
+                # than the weergavenaam), so do not answer from the cache
+                return None
+            self._store(key, docs, entry[1], True)
+            return docs[:rows]
+        return None
+
+    def put(self, query, type_filter, rows, fields, content_obj) -> "list[dict]":
+        """
+        caches the docs of content_obj (the decoded suggest response) and returns them
+        """
+        response = content_obj["response"]
+        docs = response["docs"]
+        complete = response.get("numFound", len(docs) + 1) <= len(docs)
+        key = self.get_key(query, type_filter, fields)
+        with self._lock:
+            self._store(key, docs, rows, complete)
+        return docs
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def statistics(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "prefix_hits": self.prefix_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+_suggest_cache = SuggestCache()
+
+
+def get_suggest_cache() -> SuggestCache:
+    return _suggest_cache
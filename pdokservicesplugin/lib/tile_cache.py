@@ -0,0 +1,126 @@
+import os
+import threading
+import uuid
+
+from .constants import AHN_TILE_CACHE_MAX_SIZE
+from .response_cache import get_cache_dir
+
+
+class TileCache:
+    """
+    Persistent cache of raster tiles (GeoTIFF files) on local disk. Tiles are
+    stored as {cache_dir}/{coverage_id}/{block_size}/{bx}_{by}.tif
+
+    When the total size of the tiles exceeds max_size (bytes) the least recently
+    used tiles are removed, the modification time of a tile file is used as its
+    last access time.
+    """
+
+    def __init__(self, cache_dir, max_size=AHN_TILE_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def get_tile_path(self, coverage_id, block_size, block_index):
+        (bx, by) = block_index
+        return os.path.join(
+            self.cache_dir, coverage_id, str(block_size), f"{bx}_{by}.tif"
+        )
+
+    def _list_tiles(self):
+        """returns list of (path, size, mtime) of all tiles in the cache"""
+        tiles = []
+        for root, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".tif"):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # removed in the meantime
+                tiles.append((path, stat.st_size, stat.st_mtime))
+        return tiles
+
+    def get(self, coverage_id, block_size, block_index):
+        """returns path of the cached tile, or None when the tile is not cached"""
+        path = self.get_tile_path(coverage_id, block_size, block_index)
+        with self._lock:
+            if not os.path.exists(path):
+                self.misses += 1
+                return None
+            os.utime(path)  # mark as recently used
+            self.hits += 1
+        return path
+
+    def put(self, coverage_id, block_size, block_index, content: bytes):
+        """stores content as tile, returns path of the cached tile"""
+        path = self.get_tile_path(coverage_id, block_size, block_index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so readers never see a partial tile
+        tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._list_tiles())
+            else:
+                self._size += len(content)
+            if self._size > self.max_size:
+                self._evict(keep=path)
+        return path
+
+    def _evict(self, keep=None):
+        """
+        removes least recently used tiles until the cache is below 90% of max_size,
+        caller should hold the lock
+        """
+        tiles = sorted(self._list_tiles(), key=lambda tile: tile[2])
+        self._size = sum(size for _, size, _ in tiles)
+        for path, size, _ in tiles:
+            if self._size <= 0.9 * self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._list_tiles():
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def statistics(self) -> dict:
+        with self._lock:
+            tiles = self._list_tiles()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "tiles": len(tiles),
+                "size": sum(size for _, size, _ in tiles),
+            }
+
+
+_ahn_tile_cache = None
+_ahn_tile_cache_lock = threading.Lock()
+
+
+def get_ahn_tile_cache() -> TileCache:
+    global _ahn_tile_cache
+    with _ahn_tile_cache_lock:
+        if _ahn_tile_cache is None:
+            _ahn_tile_cache = TileCache(os.path.join(get_cache_dir(), "ahn"))
+        return _ahn_tile_cache
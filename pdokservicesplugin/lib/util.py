@@ -6,3 +6,33 @@ def get_processing_error_message(
     if doing:
         message = f"{message} {doing}"
     message = f"{message}: {ex} - {traceback_str}"
+
+
+def get_peak_memory():
+    """
+    returns peak resident memory (bytes) of the current process, or None when it
+    cannot be determined on this platform
+    """
+    try:
+        import resource
+        import sys
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:  # no resource module on Windows
+        pass
+    try:
+        import psutil
+
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss)
+    except ImportError:
+        return None
+
+
+def format_memory(size):
+    """returns human readable string for size (bytes)"""
+    if size is None:
+        return "unknown"
+    return f"{size / (1024 * 1024):.1f} MB"
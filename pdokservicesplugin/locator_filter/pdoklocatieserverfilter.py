@@ -12,6 +12,7 @@ from qgis.core import (
 )
 
 from ..lib.locatieserver import suggest_query, lookup_object, Projection
+from ..lib.http_client import PdokServicesCancelledException
 
 from qgis.PyQt.QtCore import pyqtSignal
 
@@ -52,8 +53,11 @@ class PDOKLocatieserverLocatorFilter(QgsLocatorFilter):
         if len(search) < 2:
             return
         try:
-            docs = suggest_query(search)
+            # the feedback is canceled when the search is superseded by a newer one
+            docs = suggest_query(search, feedback=feedback)
             for doc in docs:
+                if feedback.isCanceled():
+                    return
                 result = QgsLocatorResult()
                 result.filter = self
                 result.displayString = "{} ({})".format(
@@ -65,6 +69,8 @@ class PDOKLocatieserverLocatorFilter(QgsLocatorFilter):
                     "score"
                 ]  # setting a score makes QGIS sort on it in the results!
                 self.resultFetched.emit(result)
+        except PdokServicesCancelledException:
+            return
         except Exception as err:
             # Handle exception..
             # only this one seems to work
@@ -79,7 +85,7 @@ class PDOKLocatieserverLocatorFilter(QgsLocatorFilter):
         # PDOK Location server return id's which have to picked up then
         id = result.userData["id"]
         try:
-            response = lookup_object(id, Projection.EPSG_4326)
+            response = lookup_object(id, Projection.EPSG_4326, fields=["type"])
             if response is not None:
                 doc = response
                 # TODO: zoom to the actual geometry instead of the centroid
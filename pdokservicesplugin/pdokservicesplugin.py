@@ -42,8 +42,6 @@ from qgis.PyQt.QtGui import (
     QImage,
 )
 from qgis.PyQt.QtCore import QSortFilterProxyModel
-# note: needed for Qt6!
-from qgis.PyQt.QtCore import QRegularExpression
 
 from qgis.core import (
     QgsApplication,
@@ -70,6 +68,7 @@ import urllib.request, urllib.parse, urllib.error
 import locale
 import re
 import logging
+import time
 from . import LOGGER_NAME
 
 log = logging.getLogger(LOGGER_NAME)
@@ -79,13 +78,26 @@ from .pdokservicesplugindialog import PdokServicesPluginDialog
 
 from .processing_provider.provider import Provider
 
-from .lib.http_client import PdokServicesNetworkException
+from .lib.http_client import (
+    PdokServicesNetworkException,
+    get_async_reply,
+    check_reply,
+    get_content_type,
+    get_http_client,
+    parse_json_content,
+    read_async_reply,
+)
+from .lib.response_cache import get_response_cache
+from .lib.suggest_cache import get_suggest_cache
+from .lib.layer_catalogue import open_layer_catalogue
+from .lib.layer_search import LayerSearchIndex, LayerSearchProxyModel
 
 from .locator_filter.pdoklocatieserverfilter import PDOKLocatieserverLocatorFilter
 
 from .lib.constants import PLUGIN_NAME, PLUGIN_ID, DEFAULT_NR_FAVS, SETTINGS_SECTIONS
 from .lib.locatieserver import (
     suggest_query,
+    get_suggest_url,
     TypeFilter,
     LsType,
     lookup_object,
@@ -114,6 +126,10 @@ class PdokServicesPlugin(object):
         self.SETTINGS_SECTION = SETTINGS_SECTIONS
         self.pointer = None
         self.geocoder_source_model = None
+        # the layer catalogue is opened on first use, see get_layer_catalogue
+        self.layer_catalogue = None
+        # reply of the running (non-blocking) toolbar suggest request
+        self.toolbar_suggest_reply = None
 
         self.fq_checkboxes = {
             self.dlg.cbx_gem: LsType.gemeente,
@@ -146,6 +162,7 @@ class PdokServicesPlugin(object):
 
         Function name should be kept as is, since it is required for a QGIS plugin. So does not conform with pep naming convention.
         """
+        start_time = time.perf_counter()
         self.run_icon = QIcon(
             os.path.join(self.plugin_dir, "resources", "icon_add_service.svg")
         )
@@ -265,7 +282,10 @@ class PdokServicesPlugin(object):
         # connect all fq checkboxes with suggest, so upon a change in fq filter we re-search
         for cbx in self.fq_checkboxes.keys():
             cbx.stateChanged.connect(self.ls_dialog_get_suggestions_and_remove_pointer)
-        self.run(True)
+        # the layer catalogue is not loaded here but when the dialog is first opened,
+        # so it does not add to the startup time of QGIS
+        self.setup_geocoder_model()
+        self.apply_flashing_geoms_setting()
 
         self.dlg.cb_flashing_geoms.toggled.connect(self.change_result_visual)
 
@@ -305,6 +325,7 @@ class PdokServicesPlugin(object):
         </html>
         """
         self.dlg.webView.setHtml(html)
+        self.info(f"initGui took {(time.perf_counter() - start_time) * 1000:.0f} ms")
 
     def about(self):
         infoString = textwrap.dedent(
@@ -320,6 +341,7 @@ class PdokServicesPlugin(object):
         )
 
     def unload(self):
+        self.abort_toolbar_suggest_request()
         try:  # using try except here because plugin could be unloaded during development: gracefully fail
             if not self.show_ls_feature():
                 self.remove_pointer()
@@ -329,6 +351,7 @@ class PdokServicesPlugin(object):
         except Exception:
             pass
         QgsApplication.processingRegistry().removeProvider(self.provider)
+        get_http_client().shutdown()
 
     def get_dd(self, val, val_string=""):
         md_item_empty = "<dd><em>Niet ingevuld</em></dd>"
@@ -358,10 +381,11 @@ class PdokServicesPlugin(object):
 
         # needed to scroll To the selected row incase of using the keyboard / arrows
         self.dlg.servicesView.scrollTo(self.dlg.servicesView.selectedIndexes()[0])
-        # itemType holds the data (== column 1)
-        self.current_layer = self.dlg.servicesView.selectedIndexes()[1].data(
+        # itemType holds the index of the layer in the catalogue (== column 1)
+        layer_index = self.dlg.servicesView.selectedIndexes()[1].data(
             Qt.ItemDataRole.UserRole
         )
+        self.current_layer = self.get_layer_catalogue().get_layer(layer_index)
         self.update_layer_panel()
 
     def update_layer_panel(self):
@@ -805,6 +829,69 @@ class PdokServicesPlugin(object):
         self.geocoderProxyModel.setFilterFixedString(string)
 
     def toolbar_search_get_suggestions(self):
+        """
+        Requests suggestions for the toolbar search text without blocking the GUI, a
+        still running request for previous text is aborted. The completer is filled
+        when the response arrives, see on_toolbar_suggest_reply_finished.
+        """
+        self.abort_toolbar_suggest_request()
+        search_text = self.toolbar_search.text()
+        type_filter = self.create_type_filter()
+        rows = 10
+        if len(search_text) <= 1 or len(type_filter.types) == 0:
+            self.toolbar_search.setCompleter(None)
+            return
+        results = get_suggest_cache().get(search_text, type_filter, rows)
+        if results is not None:
+            self.toolbar_search_set_suggestions(results)
+            return
+        url = get_suggest_url(search_text, type_filter, rows)
+        cached = get_response_cache().get(url)
+        if cached is not None:
+            content, content_type = cached
+            content_obj = parse_json_content(content, content_type)
+            results = get_suggest_cache().put(
+                search_text, type_filter, rows, None, content_obj
+            )
+            self.toolbar_search_set_suggestions(results)
+            return
+        reply = get_async_reply(url)
+        reply.finished.connect(
+            lambda: self.on_toolbar_suggest_reply_finished(
+                reply, url, search_text, type_filter, rows
+            )
+        )
+        self.toolbar_suggest_reply = reply
+
+    def abort_toolbar_suggest_request(self):
+        reply = self.toolbar_suggest_reply
+        self.toolbar_suggest_reply = None
+        if reply is not None and not reply.isFinished():
+            reply.abort()
+
+    def on_toolbar_suggest_reply_finished(
+        self, reply, url, search_text, type_filter, rows
+    ):
+        reply.deleteLater()
+        if reply is not self.toolbar_suggest_reply:
+            return  # aborted or superseded by a request for newer search text
+        self.toolbar_suggest_reply = None
+        try:
+            content = read_async_reply(reply)
+            check_reply(reply)
+            content_type = get_content_type(reply)
+            content_obj = parse_json_content(content, content_type)
+        except (PdokServicesNetworkException, ValueError) as ex:
+            # do not bother the user with a message box while typing
+            log.warning(f"toolbar suggest request failed: {ex}")
+            return
+        get_response_cache().put(url, content, content_type)
+        results = get_suggest_cache().put(
+            search_text, type_filter, rows, None, content_obj
+        )
+        self.toolbar_search_set_suggestions(results)
+
+    def toolbar_search_set_suggestions(self, results):
         def create_model(_suggestions):
             model = QStandardItemModel()
             for s in _suggestions:
@@ -814,11 +901,6 @@ class PdokServicesPlugin(object):
                 model.appendRow(it)
             return model
 
-        search_text = self.toolbar_search.text()
-        if len(search_text) <= 1:
-            self.toolbar_search.setCompleter(None)
-            return
-        results = suggest_query(search_text, self.create_type_filter())
         self.completer = QCompleter()
         self.model = create_model(results)
         self.completer.setModel(self.model)
@@ -910,14 +992,7 @@ class PdokServicesPlugin(object):
     def filter_layers(self, string):
         # remove selection if one row is selected
         self.dlg.servicesView.selectRow(0)
-        self.proxyModel.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        strlist = string.strip().split(" ")
-        string = ""
-        for s in strlist:
-            string += f"{s}.*"
-        regexp = QRegularExpression(string, QRegularExpression.PatternOption.CaseInsensitiveOption | QRegularExpression.PatternOption.InvertedGreedinessOption)
-        self.proxyModel.setFilterRegularExpression(regexp)
-        self.proxyModel.insertRow
+        self.proxyModel.set_row_scores(self.layer_search_index.search(string))
 
     def add_source_row(self, serviceLayer):
         # you can attache different "data's" to to an QStandarditem
@@ -930,22 +1005,29 @@ class PdokServicesPlugin(object):
         itemType = QStandardItem(str(stype))
         # userrole is a free form one:
         # only attach the data to the first item
-        # service layer = a dict/object with all props of the layer
-        itemType.setData(serviceLayer, Qt.ItemDataRole.UserRole)
+        # serviceLayer = a summary of the layer, the full layer is retrieved from the
+        # layer catalogue with the index when the layer is selected
+        itemType.setData(serviceLayer["index"], Qt.ItemDataRole.UserRole)
         itemType.setToolTip(f'{stype} - {serviceLayer["title"]}')
         # only wms services have styles (sometimes)
         layername = serviceLayer["title"]
-        styles_string = ""
-        if "styles" in serviceLayer:
-            styles_string = " ".join(
-                [" ".join(x.values()) for x in serviceLayer["styles"]]
-            )
+        styles_string = serviceLayer["styles_text"]
 
         itemLayername = QStandardItem(str(serviceLayer["title"]))
         itemLayername.setToolTip(f'{stype} - {serviceLayer["service_title"]}')
         # itemFilter is the item used to search filter in. That is why layername is a combi of layername + filter here
-        itemFilter = QStandardItem(
-            f'{serviceLayer["service_type"]} {layername} {serviceLayer["service_title"]} {serviceLayer["service_abstract"]} {styles_string}'
+        filter_text = f'{serviceLayer["service_type"]} {layername} {serviceLayer["service_title"]} {serviceLayer["service_abstract"]} {styles_string}'
+        itemFilter = QStandardItem(filter_text)
+        self.layer_search_index.add(
+            self.sourceModel.rowCount(),
+            {
+                "name": serviceLayer["name"],
+                "title": layername,
+                "service_title": serviceLayer["service_title"],
+                "service_type": serviceLayer["service_type"],
+                "styles": styles_string,
+                "service_abstract": serviceLayer["service_abstract"],
+            },
         )
         itemServicetitle = QStandardItem(str(serviceLayer["service_title"]))
         itemServicetitle.setToolTip(f'{stype} - {serviceLayer["title"]}')
@@ -962,14 +1044,7 @@ class PdokServicesPlugin(object):
         """
         return value.lower() == "true" if isinstance(value, str) else bool(value)
 
-    def run(self, hiddenDialog=False):
-        """
-        run method that performs all the real work
-        """
-        # last viewed/selected tab
-        if QSettings().contains(f"/{PLUGIN_ID}/currenttab"):
-            self.dlg.tabs.widget(int(QSettings().value(f"/{PLUGIN_ID}/currenttab")))
-
+    def apply_flashing_geoms_setting(self):
         flashing_geoms = self.valueToBool(
             QSettings().value(f"/{PLUGIN_ID}/flashing_geoms", defaultValue=True)
         )
@@ -978,61 +1053,90 @@ class PdokServicesPlugin(object):
         self.dlg.cb_yellow_cross.setChecked(not flashing_geoms)
         self.clean_ls_search_action.setEnabled(not flashing_geoms)
 
-        if self.services_loaded == False:
-            self.layers_pdok = []
-            pdokjson = os.path.join(self.plugin_dir, "resources", "layers-pdok.json")
-            with open(pdokjson, "r", encoding="utf-8") as f:
-                self.layers_pdok.extend(json.load(f))
+    def get_layer_catalogue(self):
+        """
+        returns the layer catalogue, the compiled resources/layers-pdok.sqlite or
+        resources/layers-pdok.json when not available. The catalogue is only opened
+        on first use (when the dialog is opened or a favourite is loaded)
+        """
+        if self.layer_catalogue is None:
+            start_time = time.perf_counter()
+            resources_dir = os.path.join(self.plugin_dir, "resources")
+            self.layer_catalogue = open_layer_catalogue(
+                os.path.join(resources_dir, "layers-pdok.json"),
+                os.path.join(resources_dir, "layers-pdok.sqlite"),
+            )
+            self.info(
+                f"opened layer catalogue {os.path.basename(self.layer_catalogue.path)} with {len(self.layer_catalogue)} layers in {(time.perf_counter() - start_time) * 1000:.0f} ms"
+            )
+        return self.layer_catalogue
 
-            self.sourceModel = QStandardItemModel()
+    def setup_geocoder_model(self):
+        self.geocoderProxyModel = QSortFilterProxyModel()
+        self.geocoder_source_model = QStandardItemModel()
 
-            self.styleFilter = QSortFilterProxyModel()
-            self.styleFilter.setSourceModel(self.sourceModel)
-            self.styleFilter.setFilterKeyColumn(4)
+        self.geocoderProxyModel.setSourceModel(self.geocoder_source_model)
+        self.geocoderProxyModel.setFilterKeyColumn(2)
+        self.dlg.geocoderResultView.setModel(self.geocoderProxyModel)
+        self.dlg.geocoderResultView.setEditTriggers(
+            QAbstractItemView.EditTrigger.NoEditTriggers
+        )
+        self.dlg.geocoderResultView.selectionModel().selectionChanged.connect(
+            self.lookup_dialog_search
+        )
 
-            self.proxyModel = QSortFilterProxyModel()
-            self.proxyModel.setSourceModel(self.styleFilter)
-            self.proxyModel.setFilterKeyColumn(3)
+    def load_services(self):
+        """
+        fills the layer model of the dialog with the layers of the layer catalogue
+        """
+        self.sourceModel = QStandardItemModel()
 
-            self.dlg.servicesView.setModel(self.proxyModel)
-            self.dlg.servicesView.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.styleFilter = QSortFilterProxyModel()
+        self.styleFilter.setSourceModel(self.sourceModel)
+        self.styleFilter.setFilterKeyColumn(4)
 
-            self.geocoderProxyModel = QSortFilterProxyModel()
-            self.geocoder_source_model = QStandardItemModel()
+        # filtering and ranking is done with the search index, see filter_layers
+        self.layer_search_index = LayerSearchIndex()
+        self.proxyModel = LayerSearchProxyModel()
+        self.proxyModel.setSourceModel(self.styleFilter)
 
-            self.geocoderProxyModel.setSourceModel(self.geocoder_source_model)
-            self.geocoderProxyModel.setFilterKeyColumn(2)
-            self.dlg.geocoderResultView.setModel(self.geocoderProxyModel)
-            self.dlg.geocoderResultView.setEditTriggers(
-                QAbstractItemView.EditTrigger.NoEditTriggers
-            )
-            for layer in self.layers_pdok:
-                if isinstance(layer["name"], str):
-                    self.add_source_row(layer)
+        self.dlg.servicesView.setModel(self.proxyModel)
+        self.dlg.servicesView.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
 
-            self.dlg.layerSearch.textChanged.connect(self.filter_layers)
-            self.dlg.servicesView.selectionModel().selectionChanged.connect(
-                self.show_layer
-            )
-            self.dlg.servicesView.doubleClicked.connect(
-                lambda: self.load_layer(None)
-            )  # Using lambda here to prevent sending signal parameters to the loadService() function
+        for layer_summary in self.get_layer_catalogue().summaries():
+            self.add_source_row(layer_summary)
 
-            self.dlg.servicesView.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-            self.dlg.servicesView.customContextMenuRequested.connect(
-                self.make_fav_context_menu
-            )
+        self.dlg.layerSearch.textChanged.connect(self.filter_layers)
+        self.dlg.servicesView.selectionModel().selectionChanged.connect(self.show_layer)
+        self.dlg.servicesView.doubleClicked.connect(
+            lambda: self.load_layer(None)
+        )  # Using lambda here to prevent sending signal parameters to the loadService() function
 
-            # actually I want to load a service when doubleclicked on header
-            # but as I cannot get this to work, let's disable clicking it then
-            self.dlg.servicesView.verticalHeader().setSectionsClickable(False)
-            self.dlg.servicesView.horizontalHeader().setSectionsClickable(False)
-            self.dlg.geocoderResultView.selectionModel().selectionChanged.connect(
-                self.lookup_dialog_search
-            )
-            # hide itemFilter column:
-            self.dlg.servicesView.hideColumn(3)
-            self.services_loaded = True
+        self.dlg.servicesView.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.dlg.servicesView.customContextMenuRequested.connect(
+            self.make_fav_context_menu
+        )
+
+        # actually I want to load a service when doubleclicked on header
+        # but as I cannot get this to work, let's disable clicking it then
+        self.dlg.servicesView.verticalHeader().setSectionsClickable(False)
+        self.dlg.servicesView.horizontalHeader().setSectionsClickable(False)
+        # hide itemFilter column:
+        self.dlg.servicesView.hideColumn(3)
+        self.services_loaded = True
+
+    def run(self, hiddenDialog=False):
+        """
+        run method that performs all the real work
+        """
+        # last viewed/selected tab
+        if QSettings().contains(f"/{PLUGIN_ID}/currenttab"):
+            self.dlg.tabs.widget(int(QSettings().value(f"/{PLUGIN_ID}/currenttab")))
+
+        self.apply_flashing_geoms_setting()
+
+        if self.services_loaded == False:
+            self.load_services()
 
         self.sourceModel.setHeaderData(2, Qt.Orientation.Horizontal, "Service")
         self.sourceModel.setHeaderData(1, Qt.Orientation.Horizontal, "Type")
@@ -1089,7 +1193,9 @@ class PdokServicesPlugin(object):
     def lookup_toolbar_search_and_zoom(self, lookup_id):
         data = None
         try:
-            data = lookup_object(lookup_id, Projection.EPSG_28992)
+            data = lookup_object(
+                lookup_id, Projection.EPSG_28992, fields=["type", "weergavenaam"]
+            )
         except PdokServicesNetworkException as ex:
             title = f"{PLUGIN_NAME} - HTTP Request Error"
             message = textwrap.dedent(
@@ -1487,7 +1593,10 @@ class PdokServicesPlugin(object):
         def predicate(x):
             return self.layer_equals_fav_layer(lyr, x)
 
-        return next(filter(predicate, self.layers_pdok), None)
+        candidates = self.get_layer_catalogue().find_layers(
+            lyr.get("service_md_id"), lyr.get("name")
+        )
+        return next(filter(predicate, candidates), None)
 
     def layer_equals_fav_layer(self, lyr, fav_lyr):
         """
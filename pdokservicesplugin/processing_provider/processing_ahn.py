@@ -4,8 +4,10 @@ import textwrap
 import uuid
 import re
 import struct
+import time
 import traceback
-from math import floor
+from contextlib import contextmanager
+from math import ceil, floor
 import email.parser
 from osgeo import gdal
 from requests.structures import CaseInsensitiveDict
@@ -27,21 +29,42 @@ from qgis.core import (
     QgsCoordinateTransform,
     QgsProcessingAlgorithm,
     QgsProcessingException,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterEnum,
+    QgsProcessingParameterNumber,
     QgsProcessingParameterString,
     QgsProcessingParameterFeatureSink,
 )
 
 from pdokservicesplugin.lib.util import (
     get_processing_error_message,
+    get_peak_memory,
+    format_memory,
 )
 
 import logging
 
 log = logging.getLogger(__name__)
 
-from ..lib.http_client import get_request_bytes, PdokServicesNetworkException
+from ..lib.http_client import (
+    get_request_bytes,
+    PdokServicesNetworkException,
+    PdokServicesCancelledException,
+    get_http_client,
+    imap_ordered,
+)
+from ..lib.profiling import (
+    start_profiling,
+    stop_profiling,
+    profile_stage,
+    add_stage,
+    report_profile,
+)
+from ..lib.response_cache import get_response_cache
+from ..lib.tile_cache import get_ahn_tile_cache
+from ..lib.constants import AHN_METADATA_CACHE_TTL, HTTP_MAX_WORKERS
 
 
 class PDOKWCSTool(QgsProcessingAlgorithm):
@@ -51,6 +74,8 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
     cap_url = f"{wcs_url}?request=GetCapabilities&service=WCS"
     coverages = ["dtm_05m", "dsm_05m"]
     default_coverage = coverages[0]
+    # report peak memory in the log every n features
+    MEMORY_REPORT_INTERVAL = 1000
 
     def tr(self, string):
         """
@@ -122,8 +147,14 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
                     <dd>coverage om te bevragen, de AHN biedt twee coverages: {", ".join(PDOKWCSTool.coverages)} (een terrein- (dtm) vs oppervlaktemodel (dsm), zie de <a href="https://www.ahn.nl/kwaliteitsbeschrijving">AHN documentatie)</a></dd>
                     <dt><b>Attribute name:</b></dt>
                     <dd>attribuutnaam om de hoogte op te slaan in de outputlaag</dd>
+                    <dt><b>Block size:</b> - <em>default value: <tt>0</tt></em></dt>
+                    <dd>grootte in cellen (bijvoorbeeld 256, dan 256x256 cellen) van de blokken waarin de punten worden gegroepeerd. Per blok met punten wordt één GetCoverage verzoek gedaan en worden alle punten in dat blok uit hetzelfde raster gelezen, dit is veel sneller voor lagen met veel punten dicht bij elkaar. Bij 0 wordt per punt een GetCoverage verzoek gedaan (handig voor enkele punten ver uit elkaar). Opgehaalde blokken worden lokaal bewaard in de cache-map van het QGIS profiel, een volgende run over hetzelfde gebied (met dezelfde coverage en blokgrootte) leest de blokken uit de cache in plaats van ze opnieuw op te vragen</dd>
+                    <dt><b>Number of concurrent requests</b> - <em>default value: <tt>1</tt></em></dt>
+                    <dd>aantal GetCoverage verzoeken dat tegelijkertijd naar de AHN WCS wordt gestuurd (maximaal {HTTP_MAX_WORKERS}), per punt of per blok. Het lezen van de rasters gebeurt ook parallel, een hogere waarde versnelt het bemonsteren van grote input-lagen. De volgorde van de features in de output-laag blijft gelijk aan de input-laag. Bij meer dan 1 verzoek tegelijk worden de GetCoverage urls niet gelogd</dd>
                     <dt><b>Output layer:</b></dt>
                     <dd>outputlaag met hoogteattribuut, projectie hetzelfde als de inputlaag</dd>
+                    <dt><b>Log timings of the processing stages:</b> - <em>default value: <tt>false</tt></em> (geavanceerde parameter)</dt>
+                    <dd>meet hoeveel tijd de tool besteedt aan de onderdelen van de verwerking (zoals netwerkverzoeken, het lezen van de rasters met GDAL, coördinaattransformaties en het schrijven van features) en toon een overzicht in het log van de tool en in het QGIS berichtenlog</dd>
                 </dl>
                 """
             )
@@ -138,6 +169,9 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
             self.OUTPUT = "OUTPUT"  # recommended name for the main output parameter
             self.ATTRIBUTE_NAME = "ATTRIBUTE_NAME"
             self.COVERAGE_ID = "COVERAGE_ID"
+            self.BLOCK_SIZE = "BLOCK_SIZE"
+            self.MAX_CONCURRENT_REQUESTS = "MAX_CONCURRENT_REQUESTS"
+            self.PROFILE = "PROFILE"
 
             self.addParameter(
                 QgsProcessingParameterFeatureSource(
@@ -165,9 +199,38 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
                     optional=True,
                 )
             ),
+            self.addParameter(
+                QgsProcessingParameterNumber(
+                    self.BLOCK_SIZE,
+                    self.tr("Block size (cells, 0 is one request per point)"),
+                    type=QgsProcessingParameterNumber.Integer,
+                    defaultValue=0,
+                    minValue=0,
+                    maxValue=4096,
+                )
+            )
+            self.addParameter(
+                QgsProcessingParameterNumber(
+                    self.MAX_CONCURRENT_REQUESTS,
+                    self.tr("Number of concurrent requests"),
+                    type=QgsProcessingParameterNumber.Integer,
+                    defaultValue=1,
+                    minValue=1,
+                    maxValue=HTTP_MAX_WORKERS,
+                )
+            )
             self.addParameter(
                 QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Output layer"))
             )
+            profile_param = QgsProcessingParameterBoolean(
+                self.PROFILE,
+                self.tr("Log timings of the processing stages"),
+                False,
+            )
+            profile_param.setFlags(
+                profile_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+            )
+            self.addParameter(profile_param)
         except Exception as e:
             # IF there is a network issue, the init of the algo would fail during the startup of QGIS, raising an exception
             # see: https://github.com/rduivenvoorde/pdokservicesplugin/issues/79
@@ -186,14 +249,24 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
                 "Raadpleeg ook de MessageLog."
             )
 
+        profiler = None
         try:
-            # retrieve wcs object
-            _xml_bytes = get_request_bytes(PDOKWCSTool.cap_url)
+            if self.parameterAsBool(parameters, self.PROFILE, context):
+                profiler = start_profiling()
+            http_stats_start = get_http_client().snapshot()
+            # retrieve wcs object, GetCapabilities and DescribeCoverage documents are
+            # cached on disk (these rarely change)
+            metadata_cache = get_response_cache("ahn_metadata", AHN_METADATA_CACHE_TTL)
+            _xml_bytes = get_request_bytes(
+                PDOKWCSTool.cap_url, cache=metadata_cache, feedback=feedback
+            )
             self.wcs = WebCoverageService_2_0_1(PDOKWCSTool.wcs_url, _xml_bytes, None)
 
             for cov in PDOKWCSTool.coverages:
                 desc_cov_url = f"{PDOKWCSTool.wcs_url}?request=DescribeCoverage&service=WCS&version=2.0.1&coverageId={cov}"
-                desc_cov_resp = get_request_bytes(desc_cov_url)
+                desc_cov_resp = get_request_bytes(
+                    desc_cov_url, cache=metadata_cache, feedback=feedback
+                )
                 self.wcs._describeCoverage[cov] = etree.fromstring(
                     desc_cov_resp
                 )  # _describeCoverage is cache for DescribeCoverage responses => https://github.com/geopython/OWSLib/blob/0eaf201d587e42237415f0010e8940275cd50ba8/owslib/coverage/wcsBase.py#LL53C37-L53C37
@@ -203,6 +276,10 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
             input_source = self.parameterAsSource(parameters, self.INPUT, context)
             in_crs = input_source.sourceCrs()
             attribute_name = parameters[self.ATTRIBUTE_NAME]
+            block_size = self.parameterAsInt(parameters, self.BLOCK_SIZE, context)
+            max_concurrent_requests = self.parameterAsInt(
+                parameters, self.MAX_CONCURRENT_REQUESTS, context
+            )
 
             coverage_id = [
                 self.coverages[i]
@@ -225,41 +302,78 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
 
             wcs_proj_authid = self.get_native_proj_authid(coverage_id)
 
+            transform_input = None
             if in_crs.authid() != wcs_proj_authid:
                 wcs_crs = QgsCoordinateReferenceSystem(wcs_proj_authid)
                 transform_input = QgsCoordinateTransform(
                     in_crs, wcs_crs, QgsProject.instance()
                 )
-            for feature in input_source.getFeatures():
-                geom = feature.geometry()
-                if in_crs.authid() != wcs_proj_authid:
-                    geom.transform(transform_input)
-                point_geom = QgsGeometry.asPoint(geom)
-                point_xy = QgsPointXY(point_geom)
-                x = point_xy.x()
-                y = point_xy.y()
-                attrs = feature.attributes()
-                new_ft = QgsFeature(fields)
-                for i in range(len(attrs)):
-                    attr = attrs[i]
-                    field_name = field_names[i]
-                    new_ft.setAttribute(field_name, attr)
 
-                ds = self.get_gdal_ds_from_wcs(x, y, coverage_id, feedback)
+            def feature_points():
+                for feature in input_source.getFeatures():
+                    geom = feature.geometry()
+                    if transform_input is not None:
+                        with profile_stage("coordinate transform"):
+                            geom.transform(transform_input)
+                    point_geom = QgsGeometry.asPoint(geom)
+                    point_xy = QgsPointXY(point_geom)
+                    yield feature, geom, point_xy.x(), point_xy.y()
+
+            feedback.pushInfo(
+                f"Peak memory at start: {format_memory(get_peak_memory())}"
+            )
+            block_values = None
+            if block_size > 0:
+                block_values = self.get_values_by_block(
+                    feature_points(),
+                    coverage_id,
+                    block_size,
+                    max_concurrent_requests,
+                    feedback,
+                )
+                if feedback.isCanceled():
+                    return {}
+                samples = (
+                    (point, block_values.get(point[0].id()))
+                    for point in feature_points()
+                )
+            else:
+
+                def sample_point(point):
+                    """
+                    Runs in a worker thread when max_concurrent_requests > 1, so should
+                    not touch the sink, the feedback object is only used to abort the
+                    request
+                    """
+                    _, _, x, y = point
+                    return point, self.get_val_from_wcs(
+                        x,
+                        y,
+                        coverage_id,
+                        feedback,
+                        log_url=max_concurrent_requests <= 1,
+                    )
 
-                if ds is None:
-                    ahn_val = None
-                else:
-                    nodata = self.get_nodata_from_gdal_ds(ds)
-                    ahn_val = self.get_val_from_gdal_ds(x, y, ds)
-                    ds = None
+                # features are read and transformed in this thread, the requests and
+                # raster reads run in the worker threads
+                samples = imap_ordered(
+                    sample_point, feature_points(), max_concurrent_requests, feedback
+                )
+
+            loop_start = time.perf_counter()
+            nr_of_features = 0
+            for i, ((feature, geom, x, y), ahn_val) in enumerate(samples):
+                nr_of_features += 1
+                attrs = feature.attributes()
+                new_ft = QgsFeature(fields)
+                for j, attr in enumerate(attrs):
+                    new_ft.setAttribute(field_names[j], attr)
 
-                if ahn_val == nodata or ahn_val == None:
+                if ahn_val is None:
                     fid = feature.id()
                     feedback.pushWarning(
                         f"NODATA value found for feature with id: {fid}, geom: POINT({x},{y})"
                     )
-                    ahn_val = None
                 else:
                     ahn_val = round(
                         ahn_val, 2
@@ -267,13 +381,29 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
 
                 new_ft.setAttribute(attribute_name, ahn_val)
                 new_ft.setGeometry(geom)
-                sink.addFeature(new_ft, QgsFeatureSink.FastInsert)
+                with profile_stage("sink.addFeature"):
+                    sink.addFeature(new_ft, QgsFeatureSink.FastInsert)
                 if feedback.isCanceled():
                     return {}
+                if (i + 1) % self.MEMORY_REPORT_INTERVAL == 0:
+                    feedback.pushInfo(
+                        f"Peak memory after {i + 1} features: {format_memory(get_peak_memory())}"
+                    )
+            add_stage(
+                "feature loop: sample elevation",
+                time.perf_counter() - loop_start,
+                nr_of_features,
+            )
+            feedback.pushInfo(f"Peak memory: {format_memory(get_peak_memory())}")
+            feedback.pushInfo(get_http_client().statistics_message(http_stats_start))
+            if profiler is not None:
+                report_profile(profiler, feedback, self.displayName())
             results = {}
             results[self.OUTPUT] = dest_id
             return results
 
+        except PdokServicesCancelledException:
+            return {}
         except PdokServicesNetworkException as ex:
             message = get_processing_error_message(
                 "an error",
@@ -291,29 +421,199 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
                 traceback.format_exc(),
             )
             raise QgsProcessingException(message)
+        finally:
+            stop_profiling(profiler)
 
-    def get_gdal_ds_from_wcs(self, x, y, coverage_id, feedback):
-        """returns none when x,y outside coverage boundingbox"""
-        (minx, miny, maxx, maxy) = self.wcs.contents[coverage_id].boundingboxes[0][
+    def get_coverage_bbox(self, coverage_id):
+        return self.wcs.contents[coverage_id].boundingboxes[0][
             "bbox"
         ]  # assuming boundingboxes[0] contains nativeproj bounding box
-        if x < minx or x > maxx or y < miny or y > maxy:
-            return None
+
+    def get_coverage_grid(self, coverage_id):
+        """returns tuple (origin, cell_size) of the coverage grid"""
         origin = [float(i) for i in self.wcs.contents[coverage_id].grid.origin]
         cell_size = float(self.wcs.contents[coverage_id].grid.offsetvectors[0][0])
+        return origin, cell_size
+
+    def get_val_from_wcs(self, x, y, coverage_id, feedback, log_url=True):
+        """
+        returns the raster value at x,y with a GetCoverage request of 2x2 cells,
+        None for NODATA and when x,y outside coverage boundingbox. Pass log_url False
+        when called from a worker thread, see get_coverage
+        """
+        (minx, miny, maxx, maxy) = self.get_coverage_bbox(coverage_id)
+        if x < minx or x > maxx or y < miny or y > maxy:
+            return None
+        origin, cell_size = self.get_coverage_grid(coverage_id)
         x_lower_bound = origin[0] + (((x - origin[0]) // cell_size) * cell_size)
         x_upper_bound = x_lower_bound + (2 * cell_size)
         y_lower_bound = origin[1] + (((y - origin[1]) // cell_size) * cell_size)
         y_upper_bound = y_lower_bound + (2 * cell_size)
+        response_body = self.get_coverage(
+            coverage_id,
+            (x_lower_bound, y_lower_bound, x_upper_bound, y_upper_bound),
+            feedback,
+            log_url,
+        )
+        with profile_stage("GDAL read raster"):
+            with self.open_gdal_ds_from_bytes(response_body) as ds:
+                return self.get_val_from_gdal_ds(x, y, ds)
+
+    def get_block_bounds(self, coverage_id, block_size, block_index):
+        """
+        returns the bounds (minx, miny, maxx, maxy) of block block_index of the grid of
+        blocks of block_size x block_size cells, aligned to the coverage grid and
+        clipped to the coverage boundingbox
+        """
+        origin, cell_size = self.get_coverage_grid(coverage_id)
+        block_extent = block_size * cell_size
+        (bx, by) = block_index
+        (minx, miny, maxx, maxy) = self.get_coverage_bbox(coverage_id)
+        return (
+            max(origin[0] + bx * block_extent, minx),
+            max(origin[1] + by * block_extent, miny),
+            min(origin[0] + (bx + 1) * block_extent, maxx),
+            min(origin[1] + (by + 1) * block_extent, maxy),
+        )
+
+    def get_values_by_block(
+        self, points, coverage_id, block_size, max_concurrent_requests, feedback
+    ):
+        """
+        Groups points (iterable of (feature, geom, x, y) tuples) in blocks of
+        block_size x block_size cells and retrieves one GetCoverage per block with
+        points, to sample all points in that block. Blocks are retrieved and sampled
+        by max_concurrent_requests worker threads.
+
+        Returns dict with feature id as key and the raster value as value, None for
+        NODATA and for points outside the coverage boundingbox
+        """
+        (minx, miny, maxx, maxy) = self.get_coverage_bbox(coverage_id)
+        origin, cell_size = self.get_coverage_grid(coverage_id)
+        block_extent = block_size * cell_size
+        # last blocks overlapping the boundingbox, a point on the max edge of the
+        # boundingbox falls in the block starting at that edge, which is empty after
+        # clipping (see get_block_bounds), so it is moved to the block before it
+        max_bx = ceil((maxx - origin[0]) / block_extent) - 1
+        max_by = ceil((maxy - origin[1]) / block_extent) - 1
+        values = {}
+        blocks = {}
+        for feature, _, x, y in points:
+            if x < minx or x > maxx or y < miny or y > maxy:
+                values[feature.id()] = None
+                continue
+            block_index = (
+                min(floor((x - origin[0]) / block_extent), max_bx),
+                min(floor((y - origin[1]) / block_extent), max_by),
+            )
+            blocks.setdefault(block_index, []).append((feature.id(), x, y))
+
+        feedback.pushInfo(
+            f"{len(blocks)} blocks for {len(values) + sum(map(len, blocks.values()))} points with block size {block_size}"
+        )
+        tile_cache = get_ahn_tile_cache()
+
+        def sample_block(block):
+            """
+            returns tuple (cache_hit, list of (fid, value)) for the points of block.
+            Runs in a worker thread when max_concurrent_requests > 1, so the feedback
+            object is only used to abort the request
+            """
+            block_index, block_points = block
+
+            def get_block_coverage():
+                bounds = self.get_block_bounds(coverage_id, block_size, block_index)
+                return self.get_coverage(
+                    coverage_id, bounds, feedback, max_concurrent_requests <= 1
+                )
+
+            def sample(ds):
+                return [
+                    (fid, self.get_val_from_gdal_ds(x, y, ds))
+                    for fid, x, y in block_points
+                ]
+
+            cache_hit = True
+            response_body = None
+            tile_path = tile_cache.get(coverage_id, block_size, block_index)
+            if tile_path is None:
+                cache_hit = False
+                response_body = get_block_coverage()
+                tile_path = tile_cache.put(
+                    coverage_id, block_size, block_index, response_body
+                )
+            try:
+                with profile_stage("GDAL read raster"):
+                    with self.open_gdal_ds(tile_path) as ds:
+                        return cache_hit, sample(ds)
+            except RuntimeError:
+                if os.path.exists(tile_path):
+                    raise
+            # the tile was evicted from the cache (by a put of another worker)
+            # before it was opened, read the response instead
+            if response_body is None:
+                cache_hit = False
+                response_body = get_block_coverage()
+            with profile_stage("GDAL read raster"):
+                with self.open_gdal_ds_from_bytes(response_body) as ds:
+                    return cache_hit, sample(ds)
+
+        cache_hits = 0
+        for i, (cache_hit, block_values) in enumerate(
+            imap_ordered(
+                sample_block, blocks.items(), max_concurrent_requests, feedback
+            )
+        ):
+            if cache_hit:
+                cache_hits += 1
+            values.update(block_values)
+            feedback.setProgress(((i + 1) / len(blocks)) * 100)
+            if feedback.isCanceled():
+                break
+        feedback.pushInfo(
+            f"{cache_hits} blocks read from the local tile cache, {len(blocks) - cache_hits} GetCoverage requests"
+        )
+        return values
+
+    def get_coverage(self, coverage_id, bounds, feedback, log_url=True):
+        """
+        returns the GeoTIFF response of a GetCoverage request for bounds, the url is
+        logged to feedback when log_url is True (not from worker threads, the log of
+        the feedback is not thread safe)
+        """
+        (x_lower_bound, y_lower_bound, x_upper_bound, y_upper_bound) = bounds
         url = f"{self.wcs_url}?service=WCS&Request=GetCoverage&version=2.0.1&CoverageId={coverage_id}&format=image/tiff&subset=x({x_lower_bound},{x_upper_bound})&subset=y({y_lower_bound},{y_upper_bound})"
-        feedback.pushInfo(f"WCS GetCoverage url: {url}")
-        response_body = get_request_bytes(url, "image/tiff")
-        uuid_string = str(uuid.uuid4())
-        tif_file_name = f"/vsimem/{uuid_string}.tif"
+        if log_url:
+            feedback.pushInfo(f"WCS GetCoverage url: {url}")
+        return get_request_bytes(url, "image/tiff", feedback=feedback)
+
+    @contextmanager
+    def open_gdal_ds(self, file_name):
+        """opens file_name as GDAL dataset, the dataset is closed on exit"""
+        gdal.UseExceptions()
+        ds = gdal.Open(file_name)
+        try:
+            yield ds
+        finally:
+            if hasattr(ds, "Close"):  # GDAL >= 3.8
+                ds.Close()
+            ds = None
+
+    @contextmanager
+    def open_gdal_ds_from_bytes(self, content):
+        """
+        opens content (GeoTIFF bytes) as GDAL dataset from a /vsimem file, the
+        dataset is closed and the /vsimem file is unlinked on exit, so memory is
+        released after sampling
+        """
+        tif_file_name = f"/vsimem/{uuid.uuid4()}.tif"
         gdal.UseExceptions()
-        gdal.FileFromMemBuffer(tif_file_name, response_body)
-        ds = gdal.Open(tif_file_name)
-        return ds
+        gdal.FileFromMemBuffer(tif_file_name, content)
+        try:
+            with self.open_gdal_ds(tif_file_name) as ds:
+                yield ds
+        finally:
+            gdal.Unlink(tif_file_name)
 
     def get_nodata_from_gdal_ds(self, ds):
         band = ds.GetRasterBand(1)  # assuming single band raster
@@ -335,14 +635,20 @@ class PDOKWCSTool(QgsProcessingAlgorithm):
         )
 
     def get_val_from_gdal_ds(self, x, y, ds):
+        """returns None for NODATA and for x,y outside the raster"""
         band = ds.GetRasterBand(1)  # assuming single band raster
         gt = ds.GetGeoTransform()
         px = floor((x - gt[0]) / gt[1])
         py = floor((y - gt[3]) / gt[5])
+        if px < 0 or px >= ds.RasterXSize or py < 0 or py >= ds.RasterYSize:
+            return None
+        nodata = self.get_nodata_from_gdal_ds(ds)
         structval = band.ReadRaster(px, py, 1, 1, buf_type=gdal.GDT_Float32)
         floatval = struct.unpack("f", structval)
         band = None
         gt = None
+        if floatval[0] == nodata:
+            return None
         return floatval[0]
 
     def get_native_proj_authid(self, coverage_id):
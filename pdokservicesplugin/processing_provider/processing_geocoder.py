@@ -5,6 +5,7 @@ Locatieserver. Tested with QGIS version 3.16, but will probably work with any \
 3.X version."""
 
 import textwrap
+import time
 import traceback
 import re
 import os.path
@@ -32,6 +33,7 @@ from qgis.core import (
     QgsProcessingParameterNumber,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterExpression,
+    QgsProcessingParameterDefinition,
     QgsExpressionContext,
     QgsExpression,
     NULL,
@@ -41,13 +43,27 @@ from pdokservicesplugin.lib.util import (
     get_processing_error_message,
 )
 
-from pdokservicesplugin.lib.http_client import PdokServicesNetworkException
+from pdokservicesplugin.lib.http_client import (
+    PdokServicesNetworkException,
+    PdokServicesCancelledException,
+    imap_ordered,
+    get_http_client,
+)
 
+from ..lib.profiling import (
+    start_profiling,
+    stop_profiling,
+    profile_stage,
+    add_stage,
+    report_profile,
+)
+from ..lib.response_cache import get_response_cache
+from ..lib.constants import HTTP_MAX_WORKERS
 from ..lib.locatieserver import (
     LsType,
     TypeFilter,
     Projection,
-    lookup_object,
+    lookup_objects,
     free_query,
 )
 
@@ -107,16 +123,18 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
         """
         return self.tr(
             textwrap.dedent(
-                """
+                f"""
                 Dit is een processing tool die de PDOK-LocatieServer geocodeer-service bevraagt met het geocode-attribuut van elke feature in de input-laag (Input layer).
                 De geometrie uit het antwoord van de geocodeer-service zal worden toegevoegd aan de output-laag.
                 Lagen zonder geometrieën zoals CSV- en Excel/XSLX-gebaseerde lagen worden ook ondersteund.
                 Bestaande attributen worden overschreven in de output-laag. Om op postcode en huisnummer te bevragen dient de input data aan het volgende format te voldoen:
 
-                <pre><code>{postcode} {huisnr}</pre></code>
+                <pre><code>{{postcode}} {{huisnr}}</pre></code>
 
                 Bijvoorbeeld: <em><tt>"6821BN 40-2"</tt></em> of <em><tt>"6821 BN 40-2"</tt></em> (zonder aanhalingstekens, merk op dat de huisnummer en postcode gescheiden zijn met een enkele spatie).
 
+                Features met dezelfde waarde voor het geocode-attribuut (na het normaliseren van spaties en de schrijfwijze van de postcode) delen één verzoek aan de geocodeer-service.
+
                 Zie ook de PDOK Locatieserver API <a href="https://github.com/PDOK/locatieserver/wiki/API-Locatieserver">documentatie</a>.
 
                 <h3>Parameters</h3>
@@ -141,8 +159,12 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
                     <dd>voeg dummy features toe (in de buurt van <tt>0,0</tt>) voor niet gevonden invoer, anders wordt deze invoer/dit record niet meegenomen in het resultaat. Dit kan handig zijn voor het naderhand handmatig verplaatsten van deze features.</dd>
                     <dt><b>Score threshold [optional]</b></dt>
                     <dd>resultaten van de geocoder bevatten een score, die een indicatie geven van hoe goed het resultaat matcht met de query, resultaten met een score lager dan de score threshold worden achterwege gelaten</dd>
+                    <dt><b>Number of concurrent requests</b> - <em>default value: <tt>1</tt></em></dt>
+                    <dd>aantal verzoeken dat tegelijkertijd naar de geocoder service wordt gestuurd (maximaal {HTTP_MAX_WORKERS}), een hogere waarde versnelt het geocoderen van grote input-lagen. De volgorde van de features in de output-laag blijft gelijk aan de input-laag</dd>
                     <dt><b>Output layer</b></dt>
                     <dd>outputlaag met het resultaat van de geocoder</dd>
+                    <dt><b>Log timings of the processing stages</b> - <em>default value: <tt>false</tt></em> (geavanceerde parameter)</dt>
+                    <dd>meet hoeveel tijd de tool besteedt aan de onderdelen van de verwerking (zoals netwerkverzoeken, JSON decoderen, geometrie conversie, coördinaattransformaties en het schrijven van features) en toon een overzicht in het log van de tool en in het QGIS berichtenlog</dd>
                 </dl>
                 """
             )
@@ -167,6 +189,8 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
         self.GET_ACTUAL_GEOM = "GET_ACTUAL_GEOM"
         self.ADD_DUMMY_GEOMETRY = "ADD_DUMMY_GEOMETRY"
         self.ADD_SCORE_FIELD = "ADD_SCORE_FIELD"
+        self.MAX_CONCURRENT_REQUESTS = "MAX_CONCURRENT_REQUESTS"
+        self.PROFILE = "PROFILE"
 
         self.addParameter(
             QgsProcessingParameterFeatureSource(
@@ -243,29 +267,71 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
                 minValue=0,
             )
         )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_CONCURRENT_REQUESTS,
+                self.tr("Number of concurrent requests"),
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=1,
+                minValue=1,
+                maxValue=HTTP_MAX_WORKERS,
+            )
+        )
+        profile_param = QgsProcessingParameterBoolean(
+            self.PROFILE,
+            self.tr("Log timings of the processing stages"),
+            False,
+        )
+        profile_param.setFlags(
+            profile_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(profile_param)
+
+    # number of object ids resolved per batched lookup request
+    LOOKUP_CHUNK_SIZE = 50
 
-    def get_geom(self, get_actual_geom, result_type, data):
+    def get_geom(self, doc, lookup_results):
         """
-        Returns a geometry depending on get_actual_geom boolean.
-        If false: return geom based on "centroide_rd" from the data
-        If true: retrieve the actual object from the lookup service and
-        return the geom based on "geometrie_rd" from the lookup response
+        Returns a geometry for geocoder result doc depending on lookup_results.
+        If None: return geom based on "centroide_rd" from the doc
+        If not None: return the geom based on "geometrie_rd" of the object with the
+        id of the doc in lookup_results, the result of the (batched) lookup
         """
-        if not get_actual_geom or result_type in [LsType.adres, LsType.postcode]:
-            wkt_point = data[0]["wkt_centroid"]
-            return QgsGeometry.fromWkt(wkt_point)
+        if lookup_results is None:
+            wkt_point = doc["wkt_centroid"]
+            with profile_stage("QgsGeometry.fromWkt"):
+                return QgsGeometry.fromWkt(wkt_point)
         else:
-            ls_id = wkt_point = data[0]["id"]
-            data = lookup_object(ls_id, Projection.EPSG_28992)
+            ls_id = doc["id"]
+            data = lookup_results.get(ls_id)
             if data is None:
                 raise QgsProcessingException(f"Failed to lookup object with id {ls_id}")
             wkt_geom = data["wkt_geom"]
-            return QgsGeometry.fromWkt(wkt_geom)
+            with profile_stage("QgsGeometry.fromWkt"):
+                return QgsGeometry.fromWkt(wkt_geom)
+
+    def get_query_string(self, attribute_val):
+        """
+        Returns the normalized Locatieserver query for the value of the geocode attribute
+        """
+        # normalize whitespace, so values only differing in whitespace share a query
+        attribute_val = " ".join(str(attribute_val).split())
+        # check if src_field_val matches postcode in format "9090AA 20-a" or "9090 AA 20-a"
+        # TODO: make explicit behind option?
+        match = re.search(r"^([0-9]{4}) ?([A-Za-z]{2})\s(.*)$", attribute_val)
+        if match and len(match.groups()) == 3:
+            postal_code = f"{match.group(1)}{match.group(2).upper()}"
+            house_nr = match.group(3)
+            return f"postcode:{postal_code} and huisnummer:{house_nr}"
+        return attribute_val
 
     def processAlgorithm(self, parameters, context, feedback):
 
         feedback.setProgress(0)
+        profiler = None
         try:
+            if self.parameterAsBool(parameters, self.PROFILE, context):
+                profiler = start_profiling()
             # read out parameters
             input_layer = self.parameterAsSource(parameters, self.INPUT, context)
             feedback.pushDebugInfo(str(input_layer))
@@ -282,6 +348,9 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
             att_expression = parameters[self.SRC_FIELD]
             get_actual_geom = parameters[self.GET_ACTUAL_GEOM]
             add_dummy_geometry = parameters[self.ADD_DUMMY_GEOMETRY]
+            max_concurrent_requests = self.parameterAsInt(
+                parameters, self.MAX_CONCURRENT_REQUESTS, context
+            )
 
             # start processing
             transform = None
@@ -323,12 +392,19 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
 
             feature_counter = 0
             feature_total = input_layer.featureCount()
-
+            cache_stats_start = get_response_cache().statistics()
+            http_stats_start = get_http_client().snapshot()
+
+            # first pass: collect the normalized query of each feature, so every
+            # distinct query is only sent once to the geocoder service
+            feature_queries = {}
+            distinct_queries = {}  # dict as ordered set
+            expr = QgsExpression(att_expression)
+            loop_start = time.perf_counter()
             for feature in input_layer.getFeatures():
-                expr = QgsExpression(att_expression)
-                context = QgsExpressionContext()
-                context.setFeature(feature)
-                attribute_val = expr.evaluate(context)
+                expression_context = QgsExpressionContext()
+                expression_context.setFeature(feature)
+                attribute_val = expr.evaluate(expression_context)
 
                 # Set returned NULL value to None (workaround, cause QGIS does not yet return a None for empty cells)
                 # TODO: add logging for skipped features
@@ -336,29 +412,112 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
                     attribute_val = None
                 if attribute_val is None:
                     continue
+                query = self.get_query_string(attribute_val)
+                feature_queries[feature.id()] = query
+                distinct_queries[query] = None
+                if feedback.isCanceled():
+                    return {}
+
+            add_stage(
+                "feature loop: read queries",
+                time.perf_counter() - loop_start,
+                len(feature_queries),
+            )
+
+            nr_saved_requests = len(feature_queries) - len(distinct_queries)
+            feedback.pushInfo(
+                f"{len(feature_queries)} features to geocode with {len(distinct_queries)} distinct values, {nr_saved_requests} requests saved by de-duplication"
+            )
 
-                # check if src_field_val matches postcode in format exactly "9090AA 20-a"
-                # TODO: make explicit behind option?
-                match = re.search(r"^([0-9]{4}[A-Za-z]{2})\s(.*)$", attribute_val)
-                if match and len(match.groups()) == 2:
-                    postal_code = match.group(1)
-                    house_nr = match.group(2)
-                    attribute_val = f"postcode:{postal_code} and huisnummer:{house_nr}"
+            def geocode(query):
+                """
+                Runs in a worker thread when max_concurrent_requests > 1, so should not
+                touch the sink, the feedback object is only used to abort the request
+                """
                 data = free_query(
-                    attribute_val, Projection.EPSG_28992, TypeFilter([result_type])
+                    query,
+                    Projection.EPSG_28992,
+                    TypeFilter([result_type]),
+                    fields=["weergavenaam", "score"],
+                    feedback=feedback,
                 )
-                geom = None
-                display_name = ""
+                doc = None
                 score = None
                 if len(data) > 0:
                     score = data[0]["score"]
-                    if score_threshold != None and score <= score_threshold:
-                        geom = None
-                    else:
-                        geom = self.get_geom(
-                            get_actual_geom, result_type, data
+                    if score_threshold == None or score > score_threshold:
+                        doc = data[0]
+                return doc, score
+
+            # second pass: resolve each distinct query once
+            query_results = {}
+            loop_start = time.perf_counter()
+            for query, result in zip(
+                distinct_queries,
+                imap_ordered(
+                    geocode, distinct_queries, max_concurrent_requests, feedback
+                ),
+            ):
+                query_results[query] = result
+                feedback.setProgress((len(query_results) / len(distinct_queries)) * 80)
+
+            add_stage(
+                "query loop: geocode",
+                time.perf_counter() - loop_start,
+                len(query_results),
+            )
+            if feedback.isCanceled():
+                return {}
+
+            # retrieve the actual geometries with batched lookups, instead of one
+            # lookup request per result
+            lookup_results = None
+            if get_actual_geom and result_type not in [LsType.adres, LsType.postcode]:
+                lookup_results = {}
+                ls_ids = list(
+                    {
+                        doc["id"]: None
+                        for doc, _ in query_results.values()
+                        if doc is not None
+                    }
+                )
+                chunks = [
+                    ls_ids[i : i + self.LOOKUP_CHUNK_SIZE]
+                    for i in range(0, len(ls_ids), self.LOOKUP_CHUNK_SIZE)
+                ]
+                for chunk_result in imap_ordered(
+                    lambda chunk: lookup_objects(
+                        chunk, Projection.EPSG_28992, feedback=feedback
+                    ),
+                    chunks,
+                    max_concurrent_requests,
+                    feedback,
+                ):
+                    lookup_results.update(chunk_result)
+                    feedback.setProgress(80 + (len(lookup_results) / len(ls_ids)) * 10)
+
+                if feedback.isCanceled():
+                    return {}
+
+            geoms = {}  # geometries by Locatieserver id, shared by features
+
+            # third pass: fan out the results to all features sharing the query,
+            # in the order of the input layer
+            loop_start = time.perf_counter()
+            for feature in input_layer.getFeatures():
+                if feature.id() not in feature_queries:
+                    continue
+                doc, score = query_results[feature_queries[feature.id()]]
+                geom = None
+                display_name = ""
+                if doc is not None:
+                    if doc["id"] not in geoms:
+                        geoms[doc["id"]] = self.get_geom(
+                            doc, lookup_results
                         )  # warning do not log geom with feedback.loginfo it will crash the processing run without error...
-                        display_name = data[0]["weergavenaam"]
+                    # copy, the geometry is shared by features with the same result
+                    geom = QgsGeometry(geoms[doc["id"]])
+                    display_name = doc["weergavenaam"]
 
                 if add_dummy_geometry and geom is None:
                     geom = QgsGeometry().fromWkt(f"POINT({dummy_x} {dummy_y})")
@@ -379,7 +538,8 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
                         transform = QgsCoordinateTransform(
                             in_crs, out_crs, QgsProject.instance()
                         )
-                        geom.transform(transform)
+                        with profile_stage("coordinate transform"):
+                            geom.transform(transform)
 
                     if add_xy_field:
                         point_geom = QgsGeometry.asPoint(geom.centroid())
@@ -395,16 +555,35 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
                     if add_score_field:
                         new_ft.setAttribute(score_att_name, score)
                     new_ft.setGeometry(geom)
-                    sink.addFeature(new_ft, QgsFeatureSink.FastInsert)
+                    with profile_stage("sink.addFeature"):
+                        sink.addFeature(new_ft, QgsFeatureSink.FastInsert)
 
                 feature_counter += 1
-                feedback.setProgress((feature_counter / feature_total) * 100)
+                feedback.setProgress(90 + (feature_counter / feature_total) * 10)
                 if feedback.isCanceled():
                     return {}
 
+            add_stage(
+                "feature loop: write output",
+                time.perf_counter() - loop_start,
+                feature_counter,
+            )
+
+            cache_stats = get_response_cache().statistics()
+            cache_hits = cache_stats["hits"] - cache_stats_start["hits"]
+            cache_misses = cache_stats["misses"] - cache_stats_start["misses"]
+            feedback.pushInfo(
+                f"Locatieserver response cache: {cache_hits} hits, {cache_misses} misses"
+            )
+            feedback.pushInfo(get_http_client().statistics_message(http_stats_start))
+            if profiler is not None:
+                report_profile(profiler, feedback, self.displayName())
+
             results = {}
             results[self.OUTPUT] = dest_id
             return results
+        except PdokServicesCancelledException:
+            return {}
         except PdokServicesNetworkException as ex:
             message = get_processing_error_message(
                 "an error",
@@ -422,3 +601,5 @@ class PDOKGeocoder(QgsProcessingAlgorithm):
                 traceback.format_exc(),
             )
             raise QgsProcessingException(message)
+        finally:
+            stop_profiling(profiler)
@@ -8,6 +8,8 @@
 import traceback
 import os.path
 import textwrap
+import time
+from math import floor
 
 from qgis.PyQt import QtGui
 from qgis.PyQt.QtCore import QCoreApplication, QVariant
@@ -26,6 +28,8 @@ from qgis.core import (
     QgsCoordinateTransform,
     QgsProcessingAlgorithm,
     QgsProcessingException,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
     QgsProcessingParameterDistance,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterEnum,
@@ -37,8 +41,19 @@ from pdokservicesplugin.lib.util import (
     get_processing_error_message,
 )
 
-from pdokservicesplugin.lib.http_client import PdokServicesNetworkException
+from pdokservicesplugin.lib.http_client import (
+    PdokServicesNetworkException,
+    PdokServicesCancelledException,
+    get_http_client,
+)
 
+from ..lib.profiling import (
+    start_profiling,
+    stop_profiling,
+    profile_stage,
+    add_stage,
+    report_profile,
+)
 from ..lib.locatieserver import (
     LsType,
     reverse_lookup,
@@ -116,8 +131,12 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
                     <dd>Op te bevragen Locatieserver result-type (adres, buurt etc) </dd>
                     <dt><b>Score threshold [optional]</b></dt>
                     <dd>resultaten van de geocoder bevatten een score die een indicatie geven van hoe goed het resultaat matcht met de query, resultaten met een score lager dan de score threshold worden achterwege gelaten</dd>
+                    <dt><b>Snapping tolerance</b> - <em>default value: <tt>0</tt></em></dt>
+                    <dd>grootte (in meters, EPSG:28992) van de gridcellen waarop de punten worden gesnapt. Punten in dezelfde gridcel delen één verzoek aan de reverse-geocoder-service, met het midden van de gridcel als locatie. <b>Let op:</b> de <tt>afstand</tt> in het resultaat én de afstand die getoetst wordt aan de threshold (de parameter <em>Score threshold</em>) zijn dan ten opzichte van het midden van de gridcel, niet ten opzichte van het inputpunt, en kunnen daarvan tot een halve diagonaal van de gridcel (ongeveer 0,71 keer de snapping tolerance) afwijken. Handig voor lagen met veel punten dicht bij elkaar, zoals GPS-tracks. Bij een waarde groter dan 0 wordt het veld <tt>ls_cache_hit</tt> toegevoegd aan de output-laag, dat aangeeft of het resultaat van een eerder punt in dezelfde gridcel is hergebruikt. Bij 0 wordt voor elk punt de service bevraagd</dd>
                     <dt><b>Output point layer</b></dt>
                     <dd>outputlaag met het resultaat van de geocoder met de toegevoegde attributen van het reverse geocoder resultaat, projectie hetzelfde als de inputlaag</dd>
+                    <dt><b>Log timings of the processing stages</b> - <em>default value: <tt>false</tt></em> (geavanceerde parameter)</dt>
+                    <dd>meet hoeveel tijd de tool besteedt aan de onderdelen van de verwerking (zoals netwerkverzoeken, JSON decoderen, coördinaattransformaties en het schrijven van features) en toon een overzicht in het log van de tool en in het QGIS berichtenlog</dd>
                 </dl>
                 """
             )
@@ -135,6 +154,8 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
         self.FIELDS = "FIELDS"
         self.RESULT_TYPE = "RESULT_TYPE"
         self.DISTANCE_THRESHOLD = "DISTANCE_THRESHOLD"
+        self.SNAP_TOLERANCE = "SNAP_TOLERANCE"
+        self.PROFILE = "PROFILE"
         self.OUTPUT = "OUTPUT"  # recommended name for the main output parameter
 
         self.addParameter(
@@ -175,12 +196,36 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
         )
         dist_param.setDefaultUnit(QgsUnitTypes.DistanceMeters)
         self.addParameter(dist_param)
+        snap_param = QgsProcessingParameterDistance(
+            self.SNAP_TOLERANCE,
+            self.tr("Snapping tolerance (0 is no snapping)"),
+            defaultValue=0,
+            minValue=0,
+        )
+        snap_param.setDefaultUnit(QgsUnitTypes.DistanceMeters)
+        self.addParameter(snap_param)
+        profile_param = QgsProcessingParameterBoolean(
+            self.PROFILE,
+            self.tr("Log timings of the processing stages"),
+            False,
+        )
+        profile_param.setFlags(
+            profile_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(profile_param)
 
     def processAlgorithm(self, parameters, context, feedback):
+        profiler = None
         try:
+            if self.parameterAsBool(parameters, self.PROFILE, context):
+                profiler = start_profiling()
+            http_stats_start = get_http_client().snapshot()
             # read out algorithm parameters
             input_points = self.parameterAsVectorLayer(parameters, self.INPUT, context)
             distance_threshold = parameters[self.DISTANCE_THRESHOLD]
+            snap_tolerance = self.parameterAsDouble(
+                parameters, self.SNAP_TOLERANCE, context
+            )
             result_type_str = [
                 self.predicates[i][0]
                 for i in self.parameterAsEnums(parameters, self.RESULT_TYPE, context)
@@ -206,6 +251,10 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
                     QgsField(field_mapping[input_field], QVariant.String)
                 )
 
+            cache_hit_field_name = "ls_cache_hit"
+            if snap_tolerance > 0:
+                input_layer_fields.append(QgsField(cache_hit_field_name, QVariant.Bool))
+
             (sink, dest_id) = self.parameterAsSink(
                 parameters,
                 self.OUTPUT,
@@ -227,12 +276,19 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
             if feedback.isCanceled():
                 return {}
 
+            # reverse geocoder responses by grid cell, reused for points in the same cell
+            grid_cache = {}
+
             # start processing features
+            point_counter = 0
+            loop_start = time.perf_counter()
             for point in input_points.getFeatures():
+                point_counter += 1
                 geom = point.geometry()
                 fid = point.id()
                 if transform:
-                    geom.transform(transform)
+                    with profile_stage("coordinate transform"):
+                        geom.transform(transform)
 
                 point_geom = QgsGeometry.asPoint(geom)
                 pxy = QgsPointXY(point_geom)
@@ -242,9 +298,32 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
                 # afstand field required, add if not requested by user
                 if "afstand" not in input_fields:
                     input_fields.append("afstand")
-                data = reverse_lookup(
-                    x_coord, y_coord, input_fields, TypeFilter([result_type])
-                )
+                cache_hit = False
+                if snap_tolerance > 0:
+                    cell = (
+                        floor(x_coord / snap_tolerance),
+                        floor(y_coord / snap_tolerance),
+                    )
+                    cache_hit = cell in grid_cache
+                    if not cache_hit:
+                        # query the center of the grid cell, so the response is
+                        # independent of which point in the cell comes first
+                        grid_cache[cell] = reverse_lookup(
+                            (cell[0] + 0.5) * snap_tolerance,
+                            (cell[1] + 0.5) * snap_tolerance,
+                            input_fields,
+                            TypeFilter([result_type]),
+                            feedback=feedback,
+                        )
+                    data = grid_cache[cell]
+                else:
+                    data = reverse_lookup(
+                        x_coord,
+                        y_coord,
+                        input_fields,
+                        TypeFilter([result_type]),
+                        feedback=feedback,
+                    )
                 # TODO: add exception handling reverse_lookup
 
                 result = None
@@ -283,15 +362,34 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
                 for key in result:
                     new_ft.setAttribute(field_mapping[key], result[key])
 
+                if snap_tolerance > 0:
+                    new_ft.setAttribute(cache_hit_field_name, cache_hit)
+
                 new_ft.setGeometry(point.geometry())
-                sink.addFeature(new_ft, QgsFeatureSink.FastInsert)
+                with profile_stage("sink.addFeature"):
+                    sink.addFeature(new_ft, QgsFeatureSink.FastInsert)
 
                 if feedback.isCanceled():
                     return {}
 
+            add_stage(
+                "feature loop: reverse geocode",
+                time.perf_counter() - loop_start,
+                point_counter,
+            )
+            if snap_tolerance > 0:
+                feedback.pushInfo(
+                    f"{len(grid_cache)} reverse geocoder requests for {point_counter} points with snapping tolerance {snap_tolerance}"
+                )
+            feedback.pushInfo(get_http_client().statistics_message(http_stats_start))
+            if profiler is not None:
+                report_profile(profiler, feedback, self.displayName())
+
             results = {}
             results[self.OUTPUT] = dest_id
             return results
+        except PdokServicesCancelledException:
+            return {}
         except PdokServicesNetworkException as pdok_ex:
             message = get_processing_error_message(
                 "an error",
@@ -309,3 +407,5 @@ class PDOKReverseGeocoder(QgsProcessingAlgorithm):
                 traceback.format_exc(),
             )
             raise QgsProcessingException(message)
+        finally:
+            stop_profiling(profiler)
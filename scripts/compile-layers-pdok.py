@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Compile layers-pdok.json into the indexed layer catalogue used by pdokservicesplugin
+
+The plugin opens the compiled catalogue (layers-pdok.sqlite) instead of parsing the
+full json file, see pdokservicesplugin/lib/layer_catalogue.py. This script is run by
+generate-pdok-layers-config.sh, run it manually after editing layers-pdok.json:
+
+`python3 ./scripts/compile-layers-pdok.py pdokservicesplugin/resources/layers-pdok.json`
+
+When no output file is given, the catalogue is written next to the json file with the
+.sqlite extension.
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import time
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def load_layer_catalogue_module():
+    # load the module from its file, importing the pdokservicesplugin package would
+    # require qgis
+    current_directory = os.path.dirname(os.path.abspath(__file__))
+    module_path = os.path.join(
+        current_directory, "..", "pdokservicesplugin", "lib", "layer_catalogue.py"
+    )
+    spec = importlib.util.spec_from_file_location("layer_catalogue", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file", help="Path of layers-pdok.json")
+    parser.add_argument(
+        "output_file",
+        nargs="?",
+        help="Path of the compiled catalogue, defaults to input file with .sqlite extension",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output_file = args.output_file
+    if output_file is None:
+        output_file = f"{os.path.splitext(args.input_file)[0]}.sqlite"
+    layer_catalogue = load_layer_catalogue_module()
+    start_time = time.perf_counter()
+    nr_of_layers = layer_catalogue.compile_catalogue(args.input_file, output_file)
+    logger.info(
+        f"compiled {nr_of_layers} layers into {output_file} ({os.path.getsize(output_file)} bytes) in {time.perf_counter() - start_time:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
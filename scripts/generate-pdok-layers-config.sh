@@ -57,3 +57,6 @@ docker run -v "${output_dir}:/output_dir" -v /tmp:/tmp "pdok/ngr-services-spider
 ) | .layers'
 
 echo "INFO: output written to $(realpath "${output_file}")"
+
+script_dir=$(dirname "$(realpath "$0")")
+python3 "${script_dir}/compile-layers-pdok.py" "$output_file_real" "${output_file_real%.json}.sqlite"
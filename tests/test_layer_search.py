@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("qgis.PyQt")
+
+from pdokservicesplugin.lib.layer_search import LayerSearchIndex, tokenize
+
+
+def create_index():
+    index = LayerSearchIndex()
+    layers = [
+        ("actueel_ortho25", "Luchtfoto Actueel Ortho 25cm RGB", "wmts"),
+        ("dtm_05m", "AHN DTM 0.5m", "wcs"),
+        ("bgt_achtergrond", "BGT Achtergrond", "wmts"),
+        ("gemeenten", "Gemeenten", "wms"),
+    ]
+    for row, (name, title, service_type) in enumerate(layers):
+        index.add(row, {"name": name, "title": title, "service_type": service_type})
+    return index
+
+
+def test_tokenize_splits_underscores():
+    assert tokenize("actueel_ortho25") == ["actueel", "ortho25", "actueel_ortho25"]
+    assert tokenize("Gemeenten WMS") == ["gemeenten", "wms"]
+
+
+@pytest.mark.parametrize(
+    "query, row",
+    [
+        ("ortho", 0),
+        ("ortho25", 0),
+        ("actueel_ortho25", 0),
+        ("05m", 1),
+        ("dtm_05m", 1),
+        ("achtergrond", 2),
+    ],
+)
+def test_search_underscore_layer_names(query, row):
+    scores = create_index().search(query)
+    assert row in scores
+
+
+def test_search_full_name_ranks_first():
+    scores = create_index().search("dtm_05m")
+    assert max(scores, key=scores.get) == 1